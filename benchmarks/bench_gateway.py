@@ -0,0 +1,139 @@
+"""Memória e custo de eventos do gateway: modo normal x modo enxuto (LEAN_GATEWAY=1).
+
+Monta um `discord.Client` sem conectar e passa payloads sintéticos pelos mesmos
+parsers que o discord.py usa com o gateway de verdade: GUILD_CREATE de cada servidor
+e um minuto simulado de eventos. No modo normal chegam a lista completa de membros
+e as atualizações de presença; no enxuto só quem está em call e os eventos de voz.
+
+Uso: python -m benchmarks.bench_gateway [servidores] [membros por servidor]
+"""
+import gc
+import random
+import sys
+import time
+import tracemalloc
+
+import discord
+
+from utils.gateway import gateway_options
+
+ONLINE = 0.3             # fração de membros online
+IN_VOICE = 0.02          # fração de membros em call
+PRESENCE_PER_MIN = 0.1   # atualizações de presença por membro online por minuto
+VOICE_PER_MIN = 0.5      # atualizações de voz por membro em call por minuto
+BOT_ID = 1
+
+def member_payload(user_id):
+    return {
+        "user": {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0",
+                 "global_name": None, "avatar": None},
+        "roles": [],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+def voice_payload(channel_id, user_id, **extra):
+    return dict({
+        "channel_id": str(channel_id) if channel_id else None,
+        "user_id": str(user_id),
+        "session_id": f"s{user_id}",
+        "deaf": False, "mute": False, "self_deaf": False, "self_mute": False,
+        "self_video": False, "suppress": False, "request_to_speak_timestamp": None,
+    }, **extra)
+
+def presence_payload(guild_id, user_id, rng):
+    return {
+        "user": {"id": str(user_id)},
+        "guild_id": str(guild_id),
+        "status": rng.choice(("online", "idle", "dnd")),
+        "activities": [{"name": rng.choice(("Valorant", "Minecraft", "Spotify")), "type": 0}],
+        "client_status": {"desktop": "online"},
+    }
+
+def build_workload(guilds, members, lean, rng):
+    """(GUILD_CREATEs, eventos de um minuto) como o Discord mandaria em cada modo."""
+    creates, events = [], []
+    for g in range(guilds):
+        guild_id = 10**6 + g
+        channel_id = guild_id * 10
+        first = 10**9 + g * members
+        user_ids = range(first, first + members)
+        online = [u for u in user_ids if rng.random() < ONLINE]
+        in_voice = [u for u in online if rng.random() < IN_VOICE / ONLINE]
+        voice_states = [voice_payload(channel_id, u) for u in in_voice]
+        payload = {
+            "id": str(guild_id), "name": f"Servidor {g}", "owner_id": str(first),
+            "member_count": members, "large": members >= 250, "roles": [], "emojis": [],
+            "features": [], "stickers": [], "threads": [], "stage_instances": [],
+            "channels": [{
+                "id": str(channel_id), "type": 2, "name": "Call", "position": 0,
+                "permission_overwrites": [], "bitrate": 64000, "user_limit": 0,
+                "rtc_region": None, "nsfw": False, "parent_id": None,
+            }],
+            "voice_states": voice_states,
+        }
+        if lean:
+            # Sem presenças o Discord manda só quem está em call
+            payload["members"] = [member_payload(u) for u in in_voice]
+        else:
+            payload["members"] = [member_payload(u) for u in user_ids]
+            payload["presences"] = [presence_payload(guild_id, u, rng) for u in online]
+            for u in online:
+                if rng.random() < PRESENCE_PER_MIN:
+                    events.append(("PRESENCE_UPDATE", presence_payload(guild_id, u, rng)))
+        creates.append(payload)
+        for u in in_voice:
+            if rng.random() < VOICE_PER_MIN:
+                events.append(("VOICE_STATE_UPDATE", voice_payload(
+                    channel_id, u, guild_id=str(guild_id), member=member_payload(u),
+                    self_mute=True,
+                )))
+    rng.shuffle(events)
+    return creates, events
+
+def run(guilds, members, lean):
+    rng = random.Random(7)
+    creates, events = build_workload(guilds, members, lean, rng)
+    gc.collect()
+    tracemalloc.start()
+    client = discord.Client(**gateway_options(lean=lean))
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data={
+        "id": str(BOT_ID), "username": "bot", "discriminator": "0", "avatar": None, "bot": True,
+    })
+    start = time.perf_counter()
+    for payload in creates:
+        state.parsers["GUILD_CREATE"](payload)
+    ready_seconds = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for name, payload in events:
+        state.parsers[name](payload)
+    event_seconds = time.perf_counter() - start
+    cached = sum(len(guild.members) for guild in client.guilds)
+    return {
+        "memory": memory,
+        "cached": cached,
+        "ready": ready_seconds,
+        "events": len(events),
+        "event_seconds": event_seconds,
+    }
+
+def main(guilds=20, members=5000):
+    print(f"{guilds} servidores x {members:,} membros, um minuto simulado de eventos")
+    for lean in (False, True):
+        result = run(guilds, members, lean)
+        rate = result["events"] / result["event_seconds"] if result["event_seconds"] else 0.0
+        print(f"{'enxuto' if lean else 'normal':>7}: memória {result['memory'] / 2**20:8.1f} MiB, "
+              f"{result['cached']:>9,} membros em cache, GUILD_CREATEs em {result['ready']:.2f}s, "
+              f"{result['events']:,} eventos/min ({rate:,.0f} eventos/s processados, "
+              f"{result['event_seconds'] * 1e3:.1f} ms de CPU por minuto)")
+        gc.collect()
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
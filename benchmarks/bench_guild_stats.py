@@ -0,0 +1,100 @@
+"""Benchmark de memória e velocidade do user_data com 1 milhão de usuários.
+
+Compara o dict antigo ({"time_<id>": segundos, "xp_<id>": ..., ...}) com as colunas
+da GuildStats: memória alocada (tracemalloc), incrementos, leituras e serialização.
+
+Uso: python -m benchmarks.bench_guild_stats [usuários]
+"""
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from utils.guild_stats import GuildStats, METRICS
+
+def build_legacy(user_ids):
+    data = {}
+    for user_id in user_ids:
+        data[f"time_{user_id}"] = 3600.0
+        data[f"xp_{user_id}"] = 60
+        data[f"nivel_{user_id}"] = 0
+        data[f"choque_dado_{user_id}"] = 1
+        data[f"choque_recebido_{user_id}"] = 1
+    return data
+
+def build_stats(user_ids):
+    stats = GuildStats()
+    for user_id in user_ids:
+        stats.set(user_id, "time", 3600.0)
+        stats.set(user_id, "xp", 60)
+        stats.set(user_id, "choque_dado", 1)
+        stats.set(user_id, "choque_recebido", 1)
+    return stats
+
+def measure(build, user_ids):
+    tracemalloc.start()
+    start = time.perf_counter()
+    data = build(user_ids)
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return data, size, elapsed
+
+def main(users=1_000_000):
+    rng = random.Random(7)
+    # IDs no formato dos snowflakes do Discord
+    user_ids = [rng.randrange(10**17, 10**18) for _ in range(users)]
+    ops = 500_000
+    sample = [rng.choice(user_ids) for _ in range(ops)]
+
+    legacy, legacy_bytes, legacy_build = measure(build_legacy, user_ids)
+    stats, stats_bytes, stats_build = measure(build_stats, user_ids)
+
+    start = time.perf_counter()
+    for user_id in sample:
+        key = f"xp_{user_id}"
+        legacy[key] = legacy.get(key, 0) + 10
+    legacy_add_us = (time.perf_counter() - start) / ops * 1e6
+
+    start = time.perf_counter()
+    for user_id in sample:
+        stats.add(user_id, "xp", 10)
+    stats_add_us = (time.perf_counter() - start) / ops * 1e6
+
+    start = time.perf_counter()
+    for user_id in sample:
+        legacy.get(f"time_{user_id}", 0)
+    legacy_get_us = (time.perf_counter() - start) / ops * 1e6
+
+    start = time.perf_counter()
+    for user_id in sample:
+        stats.get(user_id, "time")
+    stats_get_us = (time.perf_counter() - start) / ops * 1e6
+
+    start = time.perf_counter()
+    legacy_json = json.dumps(legacy)
+    legacy_dump_ms = (time.perf_counter() - start) * 1e3
+
+    start = time.perf_counter()
+    stats_json = json.dumps(stats.to_dict(), separators=(",", ":"))
+    stats_dump_ms = (time.perf_counter() - start) * 1e3
+
+    start = time.perf_counter()
+    GuildStats.from_dict(json.loads(stats_json))
+    stats_load_ms = (time.perf_counter() - start) * 1e3
+
+    print(f"{users:,} usuários, {len(METRICS)} métricas, {ops:,} operações")
+    print(f"memória (dict antigo):        {legacy_bytes / 2**20:10.1f} MiB  (montado em {legacy_build:.1f}s)")
+    print(f"memória (GuildStats):         {stats_bytes / 2**20:10.1f} MiB  (montado em {stats_build:.1f}s)")
+    print(f"incremento (dict antigo):     {legacy_add_us:10.3f} µs")
+    print(f"incremento (GuildStats):      {stats_add_us:10.3f} µs")
+    print(f"leitura (dict antigo):        {legacy_get_us:10.3f} µs")
+    print(f"leitura (GuildStats):         {stats_get_us:10.3f} µs")
+    print(f"JSON (dict antigo):           {legacy_dump_ms:10.1f} ms  ({len(legacy_json) / 2**20:.1f} MiB)")
+    print(f"JSON (GuildStats):            {stats_dump_ms:10.1f} ms  ({len(stats_json) / 2**20:.1f} MiB)")
+    print(f"carga do JSON (GuildStats):   {stats_load_ms:10.1f} ms")
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:2]]
+    main(*args)
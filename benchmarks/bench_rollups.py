@@ -0,0 +1,72 @@
+"""Benchmark dos rollups de tempo em call com 100 mil usuários por servidor.
+
+Compara o ranking/mínimo do mês vindos dos agregados (VoiceRollups) com o jeito antigo
+(filtrar as chaves `time_` e ordenar todos os usuários).
+
+Uso: python -m benchmarks.bench_rollups [usuários] [sessões]
+"""
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from utils.stats import VoiceRollups, WEEK, MONTH
+
+def main(users=100_000, sessions=300_000):
+    rng = random.Random(7)
+    guild_id = "1"
+    base = datetime(2025, 3, 3).timestamp()
+    with tempfile.NamedTemporaryFile(suffix=".json") as tmp:
+        rollups = VoiceRollups(path=tmp.name)
+        legacy = {}  # layout antigo: {"time_<id>": segundos}
+
+        start = time.perf_counter()
+        for _ in range(sessions):
+            user_id = str(rng.randrange(users))
+            join = base + rng.uniform(0, 6 * 86400)
+            leave = join + rng.uniform(60, 4 * 3600)
+            rollups.add(guild_id, user_id, join, leave)
+            legacy[f"time_{user_id}"] = legacy.get(f"time_{user_id}", 0) + leave - join
+        add_us = (time.perf_counter() - start) / sessions * 1e6
+
+        moment = datetime.fromtimestamp(base + 86400)
+        runs = 200
+        start = time.perf_counter()
+        for _ in range(runs):
+            rollups.top(guild_id, WEEK, moment, limit=10)
+        top_us = (time.perf_counter() - start) / runs * 1e6
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            rollups.month_minimum(guild_id, moment)
+        min_us = (time.perf_counter() - start) / runs * 1e6
+
+        legacy_runs = 10
+        start = time.perf_counter()
+        for _ in range(legacy_runs):
+            time_data = {uid[5:]: t for uid, t in legacy.items() if uid.startswith("time_")}
+            sorted(time_data.items(), key=lambda x: x[1], reverse=True)[:10]
+        sort_us = (time.perf_counter() - start) / legacy_runs * 1e6
+
+        start = time.perf_counter()
+        for _ in range(legacy_runs):
+            time_data = {uid: t for uid, t in legacy.items() if uid.startswith("time_")}
+            min(time_data, key=time_data.get)
+        legacy_min_us = (time.perf_counter() - start) / legacy_runs * 1e6
+
+        print(f"{users:,} usuários, {sessions:,} sessões "
+              f"({len(rollups.totals(guild_id, MONTH, moment)):,} no mês)")
+        print(f"crédito de uma sessão (rollups): {add_us:10.2f} µs")
+        print(f"top 10 da semana (rollups):      {top_us:10.2f} µs")
+        print(f"top 10 (scan + sort antigo):     {sort_us:10.2f} µs")
+        print(f"mínimo do mês (rollups):         {min_us:10.2f} µs")
+        print(f"mínimo (scan antigo):            {legacy_min_us:10.2f} µs")
+
+        start = time.perf_counter()
+        rollups.flush()
+        print(f"primeira gravação em disco:      {(time.perf_counter() - start) * 1e3:10.1f} ms")
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
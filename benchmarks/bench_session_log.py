@@ -0,0 +1,67 @@
+"""Benchmark do log de sessões de voz: custo por evento e replay de um log grande.
+
+Uso: python -m benchmarks.bench_session_log [eventos]   (padrão: 10 milhões)
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from utils.database import SessionLog
+
+def main(total_events=10_000_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, "voice_sessions.log")
+        snapshot_path = os.path.join(tmp, "voice_sessions.snapshot.json")
+        log = SessionLog(path=log_path, snapshot_path=snapshot_path, compact_every=total_events + 1)
+
+        rng = random.Random(42)
+        guilds = [str(10**17 + g) for g in range(100)]
+        ts = 1_700_000_000.0
+        start = time.perf_counter()
+        for _ in range(total_events):
+            key = (rng.choice(guilds), str(10**17 + rng.randrange(10_000)))
+            ts += 0.01
+            if key in log.open_sessions:
+                log.leave(*key, 1, ts)
+            else:
+                log.join(*key, 1, ts)
+        write_seconds = time.perf_counter() - start
+        log._file.close()
+        log._file = None
+        size_mb = os.path.getsize(log_path) / 1e6
+
+        replayed = SessionLog(path=log_path, snapshot_path=snapshot_path)
+        open_sessions = replayed.replay()
+        stats = log.stats()
+        print(f"eventos escritos:      {total_events:,} ({size_mb:.1f} MB)")
+        print(f"escrita média:         {stats['avg_append_us']:.2f} µs/evento "
+              f"({total_events / write_seconds:,.0f} eventos/s no total)")
+        print(f"replay completo:       {replayed.last_replay_seconds:.2f} s "
+              f"({total_events / replayed.last_replay_seconds:,.0f} eventos/s)")
+        print(f"sessões abertas:       {len(open_sessions):,}")
+
+        # Como no bot: a compactação roda na thread de gravação enquanto o loop segue escrevendo
+        worker = threading.Thread(target=replayed.compact)
+        pauses = []
+        start = time.perf_counter()
+        worker.start()
+        while worker.is_alive():
+            before = time.perf_counter()
+            ts += 0.01
+            replayed.move(guilds[0], "1", 1, ts)
+            pauses.append(time.perf_counter() - before)
+        worker.join()
+        compact_ms = (time.perf_counter() - start) * 1e3
+        replayed.close()
+        after = SessionLog(path=log_path, snapshot_path=snapshot_path)
+        after.replay()
+        print(f"compactação:           {compact_ms:.1f} ms na thread, maior pausa das escritas "
+              f"{max(pauses, default=0.0) * 1e3:.1f} ms ({len(pauses):,} escritas no meio)")
+        print(f"replay pós-compactação: {after.last_replay_seconds * 1e3:.1f} ms "
+              f"({len(after.open_sessions):,} sessões)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000)
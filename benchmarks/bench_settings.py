@@ -0,0 +1,59 @@
+"""Micro-benchmark do get_channel: ler server_settings.json a cada chamada x SettingsRegistry.
+
+Uso: python -m benchmarks.bench_settings [servidores] [consultas]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+from utils.database import JsonBackend, SettingsRegistry
+
+class FakeBot:
+    def __init__(self, channels):
+        self._channels = channels
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+def get_channel_from_disk(bot, backend, guild_id):
+    """Comportamento antigo do helpers.get_channel: abre e parseia o JSON toda vez."""
+    server_settings = backend.load_server_settings()
+    channel_id = server_settings.get(str(guild_id), {}).get("channel_id")
+    if isinstance(channel_id, int):
+        return bot.get_channel(channel_id)
+    return None
+
+def timed(label, lookups, fn):
+    start = time.perf_counter()
+    for i in range(lookups):
+        fn(i)
+    per_lookup = (time.perf_counter() - start) / lookups
+    print(f"{label:<28} {per_lookup * 1e6:>10.2f} µs/consulta")
+    return per_lookup
+
+def main(guilds=500, lookups=20_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = JsonBackend(config_file=os.path.join(tmp, "server_settings.json"))
+        settings = {
+            str(10**17 + g): {"channel_id": 10**18 + g, "role_id": 1, "min_call_time": 3600, "weekly_required_time": 7200}
+            for g in range(guilds)
+        }
+        with open(backend.config_file, "w") as f:
+            json.dump(settings, f, indent=4)
+        bot = FakeBot({10**18 + g: object() for g in range(guilds)})
+        registry = SettingsRegistry(backend)
+        guild_ids = list(settings)
+
+        print(f"{guilds} servidores, {lookups:,} consultas")
+        disk_lookups = max(lookups // 20, 1)  # o caminho antigo é lento demais para rodar tudo
+        before = timed("antes (lê o disco)", disk_lookups,
+                       lambda i: get_channel_from_disk(bot, backend, guild_ids[i % guilds]))
+        after = timed("depois (registry + cache)", lookups,
+                      lambda i: registry.get_channel(bot, guild_ids[i % guilds]))
+        print(f"{'ganho':<28} {before / after:>10.0f}x")
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,197 @@
+"""Objetos de mentira do Discord para rodar os handlers do bot.py sem rede.
+
+Guild/Member/VoiceState/Channel/Message/Interaction têm só o que o bot usa. Toda
+chamada que iria para a API REST passa pelo `FakeHTTP`, que conta por rota (no
+formato `MÉTODO /modelo/da/rota`) e pode simular a latência da API.
+"""
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime
+
+class FakeHTTP:
+    """Camada REST de mentira: grava cada chamada e espera `latency` segundos."""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+
+    async def request(self, method, route):
+        self.calls[f"{method} {route}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(0)  # cede o loop como uma chamada de verdade
+
+    def total(self):
+        return sum(self.calls.values())
+
+class SimClock:
+    """Relógio simulado: o `datetime.now()` do bot passa a devolver este horário."""
+    def __init__(self, start):
+        self.now = start
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def datetime_class(self):
+        clock = self
+
+        class SimDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.fromtimestamp(clock.now, tz)
+
+        return SimDatetime
+
+class Avatar:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+class FakeRole:
+    def __init__(self, role_id, name):
+        self.id = role_id
+        self.name = name
+        self.members = []
+
+class FakeMember:
+    def __init__(self, guild, user_id):
+        self.guild = guild
+        self.id = user_id
+        self.display_name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.display_avatar = Avatar()
+        self.roles = []
+        self.voice = None
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def add_roles(self, role):
+        await self.guild.http.request("PUT", "/guilds/{guild_id}/members/{user_id}/roles/{role_id}")
+        self.roles.append(role)
+        role.members.append(self)
+
+    async def remove_roles(self, role):
+        await self.guild.http.request("DELETE", "/guilds/{guild_id}/members/{user_id}/roles/{role_id}")
+        self.roles.remove(role)
+        role.members.remove(self)
+
+class FakeMessage:
+    _ids = itertools.count(10**15)
+
+    def __init__(self, channel, embed=None):
+        self.id = next(self._ids)
+        self.channel = channel
+        self.embed = embed
+
+    async def add_reaction(self, emoji):
+        await self.channel.http.request("PUT", "/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me")
+
+    async def edit(self, **fields):
+        await self.channel.http.request("PATCH", "/channels/{channel_id}/messages/{message_id}")
+
+class FakeChannel:
+    def __init__(self, guild, channel_id, name):
+        self.guild = guild
+        self.http = guild.http
+        self.id = channel_id
+        self.name = name
+
+    async def send(self, content=None, embed=None, view=None):
+        await self.http.request("POST", "/channels/{channel_id}/messages")
+        return FakeMessage(self, embed)
+
+class FakeVoiceState:
+    def __init__(self, channel=None, self_deaf=False):
+        self.channel = channel
+        self.afk = False
+        self.self_deaf = self_deaf
+        self.deaf = False
+
+class FakeGuild:
+    """Servidor com membros criados sob demanda (todo id consultado existe)."""
+    def __init__(self, http, guild_id, voice_channels=2):
+        self.http = http
+        self.id = guild_id
+        self.name = f"Servidor {guild_id}"
+        self.chunked = True
+        self.text_channels = [FakeChannel(self, guild_id * 100, "geral")]
+        self.voice_channels = [FakeChannel(self, guild_id * 100 + 1 + i, f"Call {i}") for i in range(voice_channels)]
+        self.stage_channels = []
+        self.role = FakeRole(guild_id * 100 + 50, "Tchudu Master")
+        self._members = {}
+        self.owner_id = None
+
+    def get_member(self, user_id):
+        user_id = int(user_id)
+        member = self._members.get(user_id)
+        if member is None:
+            member = self._members[user_id] = FakeMember(self, user_id)
+        return member
+
+    def get_role(self, role_id):
+        return self.role if role_id == self.role.id else None
+
+    @property
+    def owner(self):
+        return self.get_member(self.owner_id) if self.owner_id else None
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, embed=None, view=None, ephemeral=False):
+        self._done = True
+        await self._interaction.http.request("POST", "/interactions/{interaction_id}/{token}/callback")
+
+    async def defer(self, ephemeral=False, thinking=False):
+        self._done = True
+        await self._interaction.http.request("POST", "/interactions/{interaction_id}/{token}/callback")
+
+    async def edit_message(self, embed=None, view=None):
+        self._done = True
+        await self._interaction.http.request("POST", "/interactions/{interaction_id}/{token}/callback")
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, embed=None, ephemeral=False):
+        await self._interaction.http.request("POST", "/webhooks/{application_id}/{token}")
+
+class FakeInteraction:
+    def __init__(self, http, guild, user, message=None):
+        self.http = http
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.message = message
+        self.extras = {}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+class FakeGateway:
+    """Faz o papel da conexão com o Discord: servidores, canais e busca por id."""
+    def __init__(self, http, guilds, voice_channels=2):
+        self.http = http
+        self.guilds = [FakeGuild(http, 10**6 + g, voice_channels) for g in range(guilds)]
+        self._guilds = {guild.id: guild for guild in self.guilds}
+        self._channels = {
+            channel.id: channel
+            for guild in self.guilds
+            for channel in guild.text_channels + guild.voice_channels
+        }
+
+    def get_guild(self, guild_id):
+        return self._guilds.get(int(guild_id))
+
+    def get_channel(self, channel_id):
+        return self._channels.get(int(channel_id))
+
+    def attach(self, bot):
+        """Faz `bot.get_guild`/`bot.get_channel` responderem com estes objetos."""
+        bot.get_guild = self.get_guild
+        bot.get_channel = self.get_channel
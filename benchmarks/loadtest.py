@@ -0,0 +1,203 @@
+"""Teste de carga offline: os handlers reais do bot.py contra um Discord de mentira.
+
+Importa o bot.py em uma pasta temporária (os arquivos de data/ vão para lá), troca
+a conexão e a API REST pelos objetos de `benchmarks.fake_discord` e o relógio por um
+simulado, e roda três cargas:
+
+- voz: eventos de entrar/sair/trocar de canal/ensurdecer em `on_voice_state_update`,
+  com o `session_ticker` a cada SESSION_TICK_SECONDS simulados;
+- /choquederealidade e /ranking em rajada, chamando os callbacks dos comandos;
+- enquete, resumo e prêmio diários para milhares de servidores pelos jobs do agendador.
+
+Para cada uma mostra vazão, latência p50/p99, memória (RSS) e chamadas REST por rota.
+Os limites de taxa do dispatcher ficam desligados (mede o custo do bot, não a espera
+pelos baldes); `--limites` mantém os reais.
+
+Uso: python -m benchmarks.loadtest [--eventos N] [--taxa N] [--servidores N] [--usuarios N]
+                                   [--comandos N] [--broadcast N] [--latencia S] [--limites]
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_discord import FakeGateway, FakeHTTP, FakeInteraction, FakeVoiceState, SimClock  # noqa: E402
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def report(name, latencies, seconds, http, calls_before, rss_before):
+    from utils.gateway import rss_mib
+    calls = http.calls - calls_before
+    rss = rss_mib()
+    print(f"\n▶ {name}")
+    print(f"  {len(latencies):,} operações em {seconds:.2f}s ({len(latencies) / seconds:,.0f}/s)")
+    print(f"  latência p50 {percentile(latencies, 50) * 1e3:.3f} ms, p99 {percentile(latencies, 99) * 1e3:.3f} ms, "
+          f"máx {max(latencies, default=0.0) * 1e3:.3f} ms")
+    if rss is not None and rss_before is not None:
+        print(f"  RSS {rss:.1f} MiB ({rss - rss_before:+.1f} MiB)")
+    print(f"  {sum(calls.values()):,} chamadas REST")
+    for route, count in calls.most_common():
+        print(f"    {count:>9,}  {route}")
+
+async def voice_load(bot, guilds, clock, events, users, rate, rng):
+    """Cada evento muda o estado de voz de um usuário sorteado; chegam `rate` eventos por segundo simulado.
+
+    Retorna as latências dos eventos e as das passadas do `session_ticker`.
+    """
+    states = {}  # (guild_id, user_id) -> FakeVoiceState atual
+    latencies, ticks = [], []
+    tick = bot.SESSION_TICK_SECONDS
+    next_tick = clock.now + tick
+    for _ in range(events):
+        guild = rng.choice(guilds)
+        member = guild.get_member(10**9 + rng.randrange(users))
+        before = states.get((guild.id, member.id)) or FakeVoiceState()
+        roll = rng.random()
+        if before.channel is None:
+            after = FakeVoiceState(rng.choice(guild.voice_channels))
+        elif roll < 0.6:
+            after = FakeVoiceState()
+        elif roll < 0.9:
+            after = FakeVoiceState(rng.choice(guild.voice_channels), before.self_deaf)
+        else:
+            after = FakeVoiceState(before.channel, not before.self_deaf)
+        states[(guild.id, member.id)] = after
+        member.voice = after if after.channel else None
+
+        start = time.perf_counter()
+        await bot.on_voice_state_update(member, before, after)
+        latencies.append(time.perf_counter() - start)
+
+        clock.advance(1 / rate)
+        if clock.now >= next_tick:
+            start = time.perf_counter()
+            await bot.session_ticker.coro()
+            ticks.append(time.perf_counter() - start)
+            next_tick += tick
+    return latencies, ticks
+
+async def command_load(bot, http, guilds, count, users, rng):
+    """Alterna /choquederealidade e /ranking (período sorteado); latência por comando."""
+    latencies = {"choquederealidade": [], "ranking": []}
+    for i in range(count):
+        guild = rng.choice(guilds)
+        user = guild.get_member(10**9 + rng.randrange(users))
+        interaction = FakeInteraction(http, guild, user)
+        start = time.perf_counter()
+        if i % 2 == 0:
+            target = guild.get_member(10**9 + rng.randrange(users))
+            await bot.choquederealidade.callback(interaction, target)
+            latencies["choquederealidade"].append(time.perf_counter() - start)
+        else:
+            await bot.ranking.callback(interaction, rng.choice(["dia", "semana", "mes", "total"]))
+            latencies["ranking"].append(time.perf_counter() - start)
+    return latencies
+
+def due_batches(bot, guilds, clock):
+    """Lotes como o agendador montaria: (guild_id, horário local do disparo)."""
+    batches = {}
+    for guild in guilds:
+        guild_id = str(guild.id)
+        now = datetime.fromtimestamp(clock.now, bot.server_settings.timezone(guild_id))
+        # O prêmio sai no dia 1 do mês seguinte, sobre o mês do teste
+        first_of_next = (now.replace(day=28) + timedelta(days=4)).replace(day=1, hour=0, minute=5)
+        batches.setdefault("daily_poll", []).append((guild_id, now.replace(hour=7, minute=0)))
+        batches.setdefault("daily_summary", []).append((guild_id, now.replace(hour=23, minute=0)))
+        batches.setdefault("award_tchudu_master", []).append((guild_id, first_of_next))
+    return batches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eventos", type=int, default=1_000_000, help="eventos de voz")
+    parser.add_argument("--taxa", type=float, default=100.0, help="eventos de voz por segundo simulado")
+    parser.add_argument("--servidores", type=int, default=20, help="servidores nos eventos de voz e comandos")
+    parser.add_argument("--usuarios", type=int, default=1000, help="usuários por servidor")
+    parser.add_argument("--comandos", type=int, default=20_000, help="comandos na rajada")
+    parser.add_argument("--broadcast", type=int, default=5000, help="servidores no broadcast diário")
+    parser.add_argument("--latencia", type=float, default=0.0, help="latência simulada da API (s)")
+    parser.add_argument("--limites", action="store_true", help="mantém os limites de taxa do dispatcher")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="tchudu-loadtest-")
+    os.chdir(workdir)
+    os.environ["DISCORD_TOKEN"] = ""  # não conecta (e o .env não sobrescreve)
+    os.environ.setdefault("USER_DATA_FLUSH_INTERVAL", "5")
+    print(f"📂 Dados do teste em {workdir}")
+    asyncio.run(run(args))
+
+async def run(args):
+    import bot
+    from utils import dispatch
+    from utils.dispatch import TokenBucket
+    from utils.gateway import rss_mib
+
+    rng = random.Random(7)
+    http = FakeHTTP(latency=args.latencia)
+    clock = SimClock(datetime(2025, 3, 3, 12, tzinfo=timezone.utc).timestamp())
+    bot.datetime = clock.datetime_class()
+    if not args.limites:
+        for route in list(dispatch.ROUTE_LIMITS):
+            dispatch.ROUTE_LIMITS[route] = (10**9, 1.0)
+        dispatch.DEFAULT_ROUTE_LIMIT = (10**9, 1.0)
+        bot.dispatcher._global = TokenBucket(10**9, 1.0)
+        bot.dispatcher._routes.clear()
+
+    gateway = FakeGateway(http, max(args.servidores, args.broadcast))
+    gateway.attach(bot.bot)
+    for guild in gateway.guilds:
+        bot.server_settings[guild.id] = {"channel_id": guild.text_channels[0].id, "role_id": guild.role.id}
+    bot.user_store.start()
+
+    active = gateway.guilds[:args.servidores]  # os servidores com movimento em call e comandos
+
+    rss = rss_mib()
+    calls = Counter(http.calls)
+    start = time.perf_counter()
+    latencies, ticks = await voice_load(bot, active, clock, args.eventos, args.usuarios, args.taxa, rng)
+    report("on_voice_state_update", latencies, time.perf_counter() - start, http, calls, rss)
+    print(f"  session_ticker: {len(ticks):,} passadas, {sum(ticks):.2f}s no total, "
+          f"p50 {percentile(ticks, 50) * 1e3:.1f} ms, p99 {percentile(ticks, 99) * 1e3:.1f} ms")
+
+    rss = rss_mib()
+    calls = Counter(http.calls)
+    start = time.perf_counter()
+    by_command = await command_load(bot, http, active, args.comandos, args.usuarios, rng)
+    elapsed = time.perf_counter() - start
+    report("/choquederealidade + /ranking", [v for values in by_command.values() for v in values],
+           elapsed, http, calls, rss)
+    for name, values in by_command.items():
+        print(f"  /{name}: p50 {percentile(values, 50) * 1e3:.3f} ms, p99 {percentile(values, 99) * 1e3:.3f} ms")
+
+    jobs = {"daily_poll": bot.daily_poll, "daily_summary": bot.daily_summary,
+            "award_tchudu_master": bot.award_tchudu_master}
+    for name, batch in due_batches(bot, gateway.guilds[:args.broadcast], clock).items():
+        rss = rss_mib()
+        calls = Counter(http.calls)
+        start = time.perf_counter()
+        await jobs[name](batch)
+        elapsed = time.perf_counter() - start
+        durations = list(bot.dispatcher.last_reports[name].durations.values())
+        report(f"{name} ({len(durations):,} servidores)", durations, elapsed, http, calls, rss)
+
+    start = time.perf_counter()
+    bot.user_store.close()
+    bot.session_log.close()
+    print(f"\n💾 Gravação final em {time.perf_counter() - start:.2f}s; {http.total():,} chamadas REST no total")
+    print(f"📈 Pico de memória: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+if __name__ == "__main__":
+    main()
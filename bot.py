@@ -3,32 +3,155 @@ from discord import app_commands
 from discord.ext import commands, tasks
 from discord.ui import View, Button
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import os
-from typing import Optional
+import signal
+import time
+from typing import Callable, Literal, Optional
 
 # Importa funções auxiliares (ajuste para o seu projeto)
-from utils.database import load_server_settings, save_server_settings, load_user_data, save_user_data
-from utils.helpers import get_channel, format_time
+from utils.database import (
+    load_user_data, create_backend, set_backend, get_backend, get_settings_registry, default_timezone,
+    UserDataStore, SessionLog, OnboardingProgress, SqliteBackend,
+    ONBOARDING_FILE, SESSION_LOG_FILE, SESSION_SNAPSHOT_FILE,
+)
+from utils.cluster import ClusterConfig
+from utils.gateway import gateway_options, find_member, role_holders, GatewayStats
+from utils.helpers import get_channel, format_time, UserNameResolver, sync_commands_if_changed
+from utils.guild_stats import GuildStats
+from utils.stats import VoiceRollups, DAY, WEEK, MONTH, period_key, ROLLUPS_FILE
+from utils.dispatch import BroadcastDispatcher, EditDebouncer, instrument_http
+from utils.metrics import metrics, profiler, start_metrics_server
+from utils.polls import PassouPolls, DailyPollTally, PASSOU_FILE, DAILY_POLLS_FILE
+from utils.scheduler import Scheduler, SCHEDULER_STATE_FILE
+from utils.sessions import ActiveSessions, Credit
+
+STARTED_AT = time.perf_counter()  # Para medir o tempo até o bot ficar pronto
 
 # Carregar variáveis do .env
 load_dotenv()
 TOKEN: Optional[str] = os.getenv("DISCORD_TOKEN")
-
-# Carregar configurações e dados
-server_settings: dict[str, dict] = load_server_settings()
-user_data: dict[str, dict[str, float]] = load_user_data()
-
-# Configurar intents (IMPORTANTE: ativar voice_states = True)
-intents: discord.Intents = discord.Intents.default()
-intents.typing = False
-intents.presences = True
-intents.members = True
-intents.voice_states = True  # Para receber eventos de voz
-
-bot: commands.Bot = commands.Bot(command_prefix="!", intents=intents)
+DEV_GUILD_ID: Optional[str] = os.getenv("DEV_GUILD_ID")  # Sincroniza só neste servidor (desenvolvimento)
+commands_synced = False
+persistent_views_added = False  # View do /passou registrada no primeiro on_ready
+ready_after: Optional[float] = None  # Segundos até o primeiro on_ready
+
+# Shards deste processo (SHARD_COUNT/SHARD_IDS); sem elas, um processo só com tudo
+cluster = ClusterConfig.from_env()
+
+# Carregar configurações e dados (STORAGE_BACKEND=json ou sqlite)
+set_backend(create_backend())
+if cluster.multi_process and not isinstance(get_backend(), SqliteBackend):
+    # O JSON é regravado inteiro a cada gravação: um processo apagaria os dados do outro
+    raise SystemExit("❌ O modo cluster (SHARD_IDS) precisa de STORAGE_BACKEND=sqlite.")
+# Com SQLite o estado por servidor (rollups, agendador, votações, onboarding) também vai
+# para o banco, pelo guild_id: qualquer processo acha o estado de um servidor que passou a ser dele
+state_backend = get_backend() if isinstance(get_backend(), SqliteBackend) else None
+server_settings = get_settings_registry()  # dict em memória, recarrega se o arquivo mudar
+# Uma GuildStats (colunas compactas por métrica) por servidor, só dos servidores deste processo
+user_data: dict[str, GuildStats] = {
+    gid: GuildStats.from_dict(d) for gid, d in load_user_data().items() if cluster.owns(gid)
+}
+
+def guild_stats(guild_id: str) -> GuildStats:
+    key = str(guild_id)
+    stats = user_data.get(key)
+    if stats is None:
+        # setdefault montaria uma GuildStats (dict + seis arrays) a cada chamada, mesmo sem usar
+        stats = user_data[key] = GuildStats()
+    return stats
+
+# Gravação write-behind: os eventos só marcam o servidor como alterado
+user_store = UserDataStore(
+    user_data,
+    flush_interval=float(os.getenv("USER_DATA_FLUSH_INTERVAL", "5")),
+    max_dirty=int(os.getenv("USER_DATA_MAX_DIRTY", "50")),
+)
+
+# Tempo em call por dia/semana/mês, gravado junto com o user_data
+rollups = VoiceRollups(path=ROLLUPS_FILE, backend=state_backend, owns=cluster.owns)
+rollups.load()
+user_store.add_flush_hook(rollups.flush)
+
+# Quem está em call agora; tempo e XP são creditados a cada SESSION_TICK_SECONDS
+active_sessions = ActiveSessions()
+SESSION_TICK_SECONDS = float(os.getenv("SESSION_TICK_SECONDS", "60"))
+
+# Log de sessões de voz: recupera quem estava em call antes de reiniciar
+session_log = SessionLog(
+    path=cluster.data_path(SESSION_LOG_FILE),
+    snapshot_path=cluster.data_path(SESSION_SNAPSHOT_FILE),
+    compact_every=int(os.getenv("SESSION_LOG_COMPACT_EVERY", "50000")),
+)
+session_log.replay()
+user_store.add_flush_hook(session_log.compact_if_needed)  # compacta fora do loop de eventos
+print(f"🔁 {len(session_log.open_sessions)} sessões recuperadas "
+      f"({session_log.last_replay_events} eventos em {session_log.last_replay_seconds * 1000:.1f} ms)")
+
+# Intents e cache de membros (IMPORTANTE: voice_states sempre ativo).
+# LEAN_GATEWAY=1: sem presenças e só quem está em call em cache; o resto é pedido sob demanda
+LEAN_GATEWAY = os.getenv("LEAN_GATEWAY", "0") == "1"
+GATEWAY_STATS_INTERVAL = float(os.getenv("GATEWAY_STATS_INTERVAL", "0"))  # 0 = desligado
+gateway_stats = GatewayStats()
+
+# Métricas em http://METRICS_HOST:METRICS_PORT/metrics (0 = desligado); PROFILER=1 já liga o profiler
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+metrics_server = None
+metrics.histogram("voice_state_update_seconds", "Duração do on_voice_state_update")
+metrics.histogram("app_command_seconds", "Duração de cada comando slash, do clique à resposta")
+metrics.counter("app_commands_total", "Comandos slash executados, por comando e resultado")
+
+class InstrumentedTree(app_commands.CommandTree):
+    """CommandTree que marca o início de cada comando para medir a duração."""
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["started"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError) -> None:
+        record_command(interaction, interaction.command, "error")
+        await super().on_error(interaction, error)
+
+def record_command(interaction: discord.Interaction, command, result: str) -> None:
+    name = command.qualified_name if command else "desconhecido"
+    started = interaction.extras.get("started")
+    if started is not None:
+        metrics.observe("app_command_seconds", time.perf_counter() - started, command=name)
+    metrics.inc("app_commands_total", command=name, result=result)
+
+bot_class = commands.AutoShardedBot if cluster.sharded else commands.Bot
+bot: commands.Bot = bot_class(
+    command_prefix="!",
+    tree_cls=InstrumentedTree,
+    **cluster.bot_options(),
+    enable_debug_events=GATEWAY_STATS_INTERVAL > 0,  # on_socket_event_type para o GatewayStats
+    **gateway_options(lean=LEAN_GATEWAY),
+)
 tree = bot.tree  # Slash commands
+instrument_http(bot.http)  # Conta e mede toda chamada REST, por rota
+# Nomes do /ranking sem uma chamada REST por usuário
+name_resolver = UserNameResolver(bot, query_gateway=LEAN_GATEWAY)
+# Enquete, resumo e prêmio de todos os servidores (deste processo)
+scheduler = Scheduler(path=SCHEDULER_STATE_FILE, owns=cluster.owns, backend=state_backend)
+dispatcher = BroadcastDispatcher(max_concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "25")))
+edit_debouncer = EditDebouncer(interval=float(os.getenv("PASSOU_EDIT_INTERVAL", "2")))
+
+# Votações do /passou abertas (estado só em dados; a View é uma só para todas)
+passou_polls = PassouPolls(
+    path=PASSOU_FILE,
+    max_open=int(os.getenv("PASSOU_MAX_OPEN", "500")),
+    ttl=float(os.getenv("PASSOU_TTL_HOURS", "24")) * 3600,
+    backend=state_backend,
+    owns=cluster.owns,
+)
+passou_polls.load()
+user_store.add_flush_hook(passou_polls.flush)
+
+# Votos da enquete diária, contados pelos eventos de reação (sem buscar a mensagem)
+poll_tally = DailyPollTally(path=DAILY_POLLS_FILE, backend=state_backend, owns=cluster.owns)
+poll_tally.load()
+user_store.add_flush_hook(poll_tally.flush)
 
 # ============================================================
 #                    CLASSES DE VIEW
@@ -60,67 +183,105 @@ class RoleSelectionView(View):
             await interaction.response.send_message(f"✅ Cargo **{role.name}** selecionado!", ephemeral=True)
         return callback
 
+def passou_embed(poll: dict) -> discord.Embed:
+    embed = discord.Embed(
+        title="Passou ou não passou?",
+        description=f"<@{poll['accuser']}> acha que <@{poll['accused']}> se passou demais!",
+        color=discord.Color.orange()
+    )
+    embed.set_image(url="https://i.gifer.com/72gi.gif")
+    embed.add_field(name="Sim", value=str(poll["sim"]), inline=True)
+    embed.add_field(name="Não", value=str(poll["nao"]), inline=True)
+    return embed
+
+# A votação é registrada logo depois do envio; cliques nesse intervalo pedem para tentar de novo
+PASSOU_OPENING_GRACE = timedelta(seconds=30)
+
 class PassouView(discord.ui.View):
     """View com botões: Sim, Não e, quando houver votos suficientes, Condenar.
        Permite que cada usuário vote apenas uma vez.
-    """
-    def __init__(self, accuser: discord.Member, accused: discord.Member):
-        super().__init__(timeout=None)  # Sem timeout (ou defina um se preferir)
-        self.accuser = accuser
-        self.accused = accused
-        self.sim_count = 0
-        self.nao_count = 0
-        self.voted = set()  # Armazena os IDs dos usuários que já votaram
-
-    def create_embed(self) -> discord.Embed:
-        embed = discord.Embed(
-            title="Passou ou não passou?",
-            description=f"{self.accuser.mention} acha que {self.accused.mention} se passou demais!",
-            color=discord.Color.orange()
-        )
-        embed.set_image(url="https://i.gifer.com/72gi.gif")
-        embed.add_field(name="Sim", value=str(self.sim_count), inline=True)
-        embed.add_field(name="Não", value=str(self.nao_count), inline=True)
-        return embed
 
-    @discord.ui.button(label="Sim", style=discord.ButtonStyle.success)
-    async def sim_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id in self.voted:
+       É persistente: os botões têm custom_id fixo e uma única instância (registrada
+       com `bot.add_view`) atende todas as votações. O estado fica em `passou_polls`,
+       pelo id da mensagem. O clique só confirma o voto; o embed é atualizado pelo
+       `edit_debouncer`, no máximo uma edição por mensagem a cada intervalo.
+    """
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @classmethod
+    def render(cls, poll: Optional[dict]) -> "PassouView":
+        """Botões no estado da votação (None = encerrada), só para enviar/editar a mensagem."""
+        view = cls()
+        if poll is None or poll["condemned"]:
+            for child in view.children:
+                child.disabled = True
+        else:
+            # Habilita o botão 'Condenar' se houver pelo menos 2 votos de "Sim"
+            view.condenar_button.disabled = poll["sim"] < 2
+        view.stop()  # parada, a View não fica guardada no bot junto com a mensagem
+        return view
+
+    async def closed(self, interaction: discord.Interaction) -> None:
+        await interaction.response.edit_message(view=PassouView.render(None))
+
+    async def unknown(self, interaction: discord.Interaction) -> None:
+        """Votação não encontrada: numa mensagem recém-enviada o /passou ainda está registrando."""
+        if discord.utils.utcnow() - interaction.message.created_at < PASSOU_OPENING_GRACE:
+            await interaction.response.send_message("A votação ainda está abrindo, tente de novo! ⏳", ephemeral=True)
+        else:
+            await self.closed(interaction)
+
+    async def vote(self, interaction: discord.Interaction, choice: str) -> None:
+        message = interaction.message
+        if passou_polls.get(message.id) is None:
+            await self.unknown(interaction)
+            return
+        if not passou_polls.vote(message.id, interaction.user.id, choice):
             await interaction.response.send_message("Você já votou!", ephemeral=True)
             return
+        await interaction.response.defer()  # confirma o clique sem editar a mensagem
+        refresh_passou(message)
 
-        self.voted.add(interaction.user.id)
-        self.sim_count += 1
-
-        # Habilita o botão 'Condenar' se houver pelo menos 2 votos de "Sim"
-        if self.sim_count >= 2:
-            self.condenar_button.disabled = False
-
-        await interaction.response.edit_message(embed=self.create_embed(), view=self)
+    @discord.ui.button(label="Sim", style=discord.ButtonStyle.success, custom_id="passou:sim")
+    async def sim_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.vote(interaction, "sim")
 
-    @discord.ui.button(label="Não", style=discord.ButtonStyle.danger)
+    @discord.ui.button(label="Não", style=discord.ButtonStyle.danger, custom_id="passou:nao")
     async def nao_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id in self.voted:
-            await interaction.response.send_message("Você já votou!", ephemeral=True)
-            return
-
-        self.voted.add(interaction.user.id)
-        self.nao_count += 1
-        await interaction.response.edit_message(embed=self.create_embed(), view=self)
+        await self.vote(interaction, "nao")
 
-    @discord.ui.button(label="Condenar", style=discord.ButtonStyle.primary, disabled=True)
+    @discord.ui.button(label="Condenar", style=discord.ButtonStyle.primary, disabled=True, custom_id="passou:condenar")
     async def condenar_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        message = interaction.message
+        poll = passou_polls.get(message.id)
+        if poll is None:
+            await self.unknown(interaction)
+            return
+        if poll["sim"] < 2 or not passou_polls.condemn(message.id):
+            await interaction.response.send_message("Não dá para condenar agora!", ephemeral=True)
+            return
         condemnation_embed = discord.Embed(
             title="Condenado!",
-            description=f"{self.accused.mention} foi condenado(a) por se passar demais!",
+            description=f"<@{poll['accused']}> foi condenado(a) por se passar demais!",
             color=discord.Color.red()
         )
         condemnation_embed.set_image(url="https://i.gifer.com/EfF.gif")
         await interaction.response.send_message(embed=condemnation_embed)
         # Desabilita os botões após a condenação
-        for child in self.children:
-            child.disabled = True
-        await interaction.message.edit(view=self)
+        refresh_passou(message)
+
+def refresh_passou(message: discord.Message) -> None:
+    """Agenda a atualização do embed da votação (edições seguidas viram uma só)."""
+    async def edit() -> None:
+        poll = passou_polls.get(message.id)
+        if poll is None:
+            return
+        await dispatcher.call(
+            "edit_message", message.channel.id,
+            lambda: message.edit(embed=passou_embed(poll), view=PassouView.render(poll)),
+        )
+    edit_debouncer.schedule(message.id, edit)
 
 # ============================================================
 #                 COMANDOS SLASH
@@ -134,9 +295,10 @@ async def passou(interaction: discord.Interaction, target: discord.Member) -> No
     """
     accuser = interaction.user
     accused = target
-    view = PassouView(accuser, accused)
-    embed = view.create_embed()
-    await interaction.response.send_message(embed=embed, view=view)
+    poll = {"accuser": accuser.id, "accused": accused.id, "sim": 0, "nao": 0, "condemned": False}
+    await interaction.response.send_message(embed=passou_embed(poll), view=PassouView.render(poll))
+    message = await interaction.original_response()
+    passou_polls.open(message.id, interaction.guild_id, message.channel.id, accuser.id, accused.id)
 
 @tree.command(name="choquederealidade", description="Dá um choque de realidade em alguém!")
 async def choquederealidade(interaction: discord.Interaction, target: discord.Member) -> None:
@@ -148,27 +310,11 @@ async def choquederealidade(interaction: discord.Interaction, target: discord.Me
     receiver: discord.Member = target
     guild_id: str = str(interaction.guild.id)
 
-    if guild_id not in user_data:
-        user_data[guild_id] = {}
-
-    giver_dado_key = f"choque_dado_{giver.id}"
-    giver_recebido_key = f"choque_recebido_{giver.id}"
-    receiver_dado_key = f"choque_dado_{receiver.id}"
-    receiver_recebido_key = f"choque_recebido_{receiver.id}"
+    stats = guild_stats(guild_id)
+    stats.add(giver.id, "choque_dado", 1)
+    stats.add(receiver.id, "choque_recebido", 1)
 
-    if giver_dado_key not in user_data[guild_id]:
-        user_data[guild_id][giver_dado_key] = 0
-    if giver_recebido_key not in user_data[guild_id]:
-        user_data[guild_id][giver_recebido_key] = 0
-    if receiver_dado_key not in user_data[guild_id]:
-        user_data[guild_id][receiver_dado_key] = 0
-    if receiver_recebido_key not in user_data[guild_id]:
-        user_data[guild_id][receiver_recebido_key] = 0
-
-    user_data[guild_id][giver_dado_key] += 1
-    user_data[guild_id][receiver_recebido_key] += 1
-
-    save_user_data(user_data)
+    user_store.mark_dirty(guild_id, giver.id, receiver.id)
 
     embed = discord.Embed(
         title="⚡ Choque de Realidade!",
@@ -180,54 +326,63 @@ async def choquederealidade(interaction: discord.Interaction, target: discord.Me
     embed.set_footer(text=receiver.display_name, icon_url=receiver.display_avatar.url)
     embed.add_field(
         name=f"{giver.display_name}",
-        value=(f"**Choques dados:** {user_data[guild_id][giver_dado_key]}\n"
-               f"**Choques recebidos:** {user_data[guild_id][giver_recebido_key]}"),
+        value=(f"**Choques dados:** {stats.get(giver.id, 'choque_dado')}\n"
+               f"**Choques recebidos:** {stats.get(giver.id, 'choque_recebido')}"),
         inline=True
     )
     embed.add_field(
         name=f"{receiver.display_name}",
-        value=(f"**Choques dados:** {user_data[guild_id][receiver_dado_key]}\n"
-               f"**Choques recebidos:** {user_data[guild_id][receiver_recebido_key]}"),
+        value=(f"**Choques dados:** {stats.get(receiver.id, 'choque_dado')}\n"
+               f"**Choques recebidos:** {stats.get(receiver.id, 'choque_recebido')}"),
         inline=True
     )
 
     await interaction.response.send_message(embed=embed)
 
+PERIOD_LABELS = {DAY: "Hoje", WEEK: "Semana", MONTH: "Mês", "total": "Geral"}
+
 @tree.command(name="ranking", description="Mostra quem ficou mais tempo em call")
-async def ranking(interaction: discord.Interaction, periodo: Optional[str] = "semana") -> None:
+async def ranking(
+    interaction: discord.Interaction,
+    periodo: Literal["dia", "semana", "mes", "total"] = "semana",
+) -> None:
     guild_id = str(interaction.guild_id)
     if guild_id not in user_data:
         await interaction.response.send_message("Nenhum dado registrado ainda! 😢", ephemeral=True)
         return
 
-    time_data = {
-        uid[5:]: t
-        for uid, t in user_data[guild_id].items() 
-        if uid.startswith("time_")
-    }
-    if not time_data:
+    if periodo == "total":
+        top_users = user_store.top_users(guild_id, "time", 10)
+    else:
+        top_users = rollups.top(guild_id, periodo, datetime.now(server_settings.timezone(guild_id)), limit=10)
+    if not top_users:
         await interaction.response.send_message("Nenhum usuário válido encontrado para o ranking. 😢", ephemeral=True)
         return
 
-    sorted_users = sorted(time_data.items(), key=lambda x: x[1], reverse=True)
+    # Se algum nome precisar da API, adia a resposta para não estourar os 3 segundos
+    deferred = bool(name_resolver.missing(interaction.guild, [u_id for u_id, _ in top_users]))
+    if deferred:
+        await interaction.response.defer()
+    names = await name_resolver.resolve(interaction.guild, [u_id for u_id, _ in top_users])
+
     embed = discord.Embed(
-        title=f"🏆 Ranking - {periodo.capitalize()}",
+        title=f"🏆 Ranking - {PERIOD_LABELS[periodo]}",
         description="Veja quem mais ficou em call!",
         color=discord.Color.gold()
     )
-    for i, (u_id, tempo) in enumerate(sorted_users[:10], start=1):
-        user = await bot.fetch_user(int(u_id))
-        embed.add_field(name=f"{i}️⃣ {user.name}", value=f"🕒 {format_time(tempo)}", inline=False)
-    await interaction.response.send_message(embed=embed)
+    for i, (u_id, tempo) in enumerate(top_users, start=1):
+        embed.add_field(name=f"{i}️⃣ {names[int(u_id)]}", value=f"🕒 {format_time(tempo)}", inline=False)
+    if deferred:
+        await interaction.followup.send(embed=embed)
+    else:
+        await interaction.response.send_message(embed=embed)
 
 @tree.command(name="level", description="Mostra seu XP e nível no servidor")
 async def level(interaction: discord.Interaction) -> None:
     guild_id = str(interaction.guild_id)
-    user_id = str(interaction.user.id)
-    xp_key = f"xp_{user_id}"
-    nivel_key = f"nivel_{user_id}"
-    xp_total = user_data.get(guild_id, {}).get(xp_key, 0)
-    nivel = user_data.get(guild_id, {}).get(nivel_key, 0)
+    stats = user_data.get(guild_id)
+    xp_total = stats.get(interaction.user.id, "xp") if stats else 0
+    nivel = stats.get(interaction.user.id, "nivel") if stats else 0
     embed = discord.Embed(
         title="📊 Seu progresso",
         description=f"🎮 **XP:** {xp_total}\n🏆 **Nível:** {nivel}",
@@ -241,52 +396,199 @@ async def level(interaction: discord.Interaction) -> None:
 
 @bot.event
 async def on_ready() -> None:
+    global commands_synced, ready_after, persistent_views_added, metrics_server
     print(f'✅ Bot {bot.user.name} está online!' if bot.user else "Bot está online!")
-    try:
-        synced = await bot.tree.sync()
-        print(f"📌 Sincronizados {len(synced)} comandos slash!")
+    if cluster.sharded:
+        print(f"🧩 Processo {cluster.name}: {len(bot.guilds)} servidores em {len(bot.shards)} shards")
+    if not persistent_views_added:
+        # Atende os botões de todas as votações do /passou, inclusive as de antes de reiniciar
+        bot.add_view(PassouView())
+        persistent_views_added = True
+    # Comandos slash são globais: no modo cluster só o processo do shard 0 sincroniza
+    if not commands_synced and cluster.syncs_commands:
+        try:
+            # Só chama a API se os comandos mudaram desde a última sincronização
+            dev_guild = discord.Object(id=int(DEV_GUILD_ID)) if DEV_GUILD_ID else None
+            synced = await sync_commands_if_changed(bot, guild=dev_guild)
+            commands_synced = True
+            if synced is None:
+                print("📌 Comandos slash sem alterações, sincronização pulada.")
+            else:
+                print(f"📌 Sincronizados {len(synced)} comandos slash!")
+
+                # Listar os comandos sincronizados
+                for command in synced:
+                    print(f"- {command.name}")
+        except Exception as e:
+            print(f"❌ Erro ao sincronizar comandos: {e}")
+
+    restore_voice_sessions()
+
+    # start() é idempotente e schedule() mantém o que já estiver agendado, então
+    # reconexões (que chamam on_ready de novo) não duplicam tarefas
+    scheduler.start()
+    if not session_ticker.is_running():
+        session_ticker.start()
+    if METRICS_PORT and metrics_server is None:
+        metrics_server = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        print(f"📈 Métricas em http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        if os.getenv("PROFILER", "0") == "1":
+            profiler.start()
+    if GATEWAY_STATS_INTERVAL > 0 and not gateway_report.is_running():
+        gateway_report.change_interval(seconds=GATEWAY_STATS_INTERVAL)
+        gateway_report.start()
+    for guild_id in server_settings:
+        scheduler.schedule(guild_id)
+
+    # A configuração de servidores novos roda em segundo plano, sem segurar o resto
+    for guild in bot.guilds:
+        if str(guild.id) not in server_settings:
+            start_onboarding(guild)
 
-        # Listar os comandos sincronizados
-        for command in synced:
-            print(f"- {command.name}")
-    except Exception as e:
-        print(f"❌ Erro ao sincronizar comandos: {e}")
+    if ready_after is None:
+        ready_after = time.perf_counter() - STARTED_AT
+        print(f"⏱️ Pronto em {ready_after:.2f}s desde a inicialização.")
+
+def is_idle(state: discord.VoiceState) -> bool:
+    """No canal AFK ou surdo: fica na call, mas não acumula tempo nem XP."""
+    return bool(state.afk or state.self_deaf or state.deaf)
 
+def restore_voice_sessions() -> None:
+    """Confere a tabela de sessões (e as recuperadas do log) com quem realmente está em call agora."""
+    now = datetime.now(timezone.utc).timestamp()
+    in_voice: dict[tuple[str, str], tuple[int, bool]] = {}
     for guild in bot.guilds:
-        if str(guild.id) not in server_settings:
-            await setup_server(guild)
+        guild_id = str(guild.id)
+        for channel in guild.voice_channels + guild.stage_channels:
+            # voice_states não depende do cache de membros (vale também no modo enxuto)
+            for user_id, state in channel.voice_states.items():
+                in_voice[(guild_id, str(user_id))] = (channel.id, is_idle(state))
+
+    for key in set(active_sessions.keys()) | set(session_log.open_sessions):
+        if key not in in_voice:
+            # Saiu enquanto o bot estava fora: não dá pra saber quando, então descarta
+            active_sessions.discard(*key)
+            session_log.leave(*key, None, now)
+
+    credits = []
+    for key, (channel_id, paused) in in_voice.items():
+        if key in active_sessions:
+            credit = active_sessions.update(*key, channel_id, paused, now)
+            if credit:
+                credits.append(credit)
+            continue
+        recovered = session_log.open_sessions.get(key)
+        # Sessão recuperada: guarda o início original, mas só credita a partir de agora
+        active_sessions.start(*key, channel_id, now, paused, started=recovered[0] if recovered else None)
+        if not recovered:
+            session_log.join(*key, channel_id, now)
+    apply_credits(credits)
+    stats = session_log.stats()
+    print(f"📝 Log de sessões: {stats['appends']} eventos, {stats['avg_append_us']:.1f} µs por escrita, "
+          f"{len(active_sessions)} pessoas em call")
+
+# ============================================================
+#               CONFIGURAÇÃO DE SERVIDORES NOVOS
+# ============================================================
+
+# Em que passo cada servidor parou
+onboarding = OnboardingProgress(path=ONBOARDING_FILE, backend=state_backend, owns=cluster.owns)
+onboarding_semaphore = asyncio.Semaphore(int(os.getenv("ONBOARDING_CONCURRENCY", "5")))
+onboarding_tasks: dict[str, asyncio.Task] = {}
+owner_locks: dict[int, asyncio.Lock] = {}  # Um diálogo por dono de cada vez
+pending_replies: dict[int, tuple[asyncio.Future, Callable[[discord.Message], bool]]] = {}
 
-    schedule_poll.start()
-    schedule_summary.start()
-    award_tchudu_master.start()
+def start_onboarding(guild: discord.Guild) -> None:
+    guild_id = str(guild.id)
+    if guild_id in onboarding_tasks:
+        return
+    onboarding_tasks[guild_id] = asyncio.create_task(run_onboarding(guild))
+
+async def run_onboarding(guild: discord.Guild) -> None:
+    guild_id = str(guild.id)
+    try:
+        await setup_server(guild)
+    except Exception as e:
+        print(f"❌ Erro ao configurar o servidor {guild.name}: {e}")
+    finally:
+        onboarding_tasks.pop(guild_id, None)
+
+async def wait_for_owner_reply(owner_id: int, check: Callable[[discord.Message], bool], timeout: float) -> discord.Message:
+    """Como bot.wait_for('message'), mas indexado pelo dono: cada DM só é conferida pela sessão dele."""
+    future = asyncio.get_running_loop().create_future()
+    pending_replies[owner_id] = (future, check)
+    try:
+        return await asyncio.wait_for(future, timeout=timeout)
+    finally:
+        if pending_replies.get(owner_id, (None,))[0] is future:
+            del pending_replies[owner_id]
+
+@bot.listen("on_message")
+async def route_owner_reply(message: discord.Message) -> None:
+    if message.guild is not None:
+        return
+    pending = pending_replies.get(message.author.id)
+    if pending:
+        future, check = pending
+        if not future.done() and check(message):
+            future.set_result(message)
+
+async def find_channel_reply(owner: discord.Member, prompt_id: int, check: Callable[[discord.Message], bool]) -> Optional[discord.Message]:
+    """Procura uma resposta que o dono mandou enquanto o bot estava fora do ar."""
+    dm = owner.dm_channel or await owner.create_dm()
+    async for message in dm.history(after=discord.Object(id=prompt_id), limit=50):
+        if check(message):
+            return message
+    return None
 
 async def setup_server(guild: discord.Guild) -> None:
     guild_id = str(guild.id)
     if guild_id in server_settings:
         print(f"✅ Servidor {guild.name} já configurado. Pulando setup.")
         return
-    owner: Optional[discord.Member] = guild.owner
+    async with onboarding_semaphore:
+        owner: Optional[discord.Member] = guild.owner or await find_member(guild, guild.owner_id)
     if not owner:
         return
 
+    # A trava do dono vem antes da vaga no semáforo: um dono com vários servidores
+    # esperando a vez não ocupa as vagas dos diálogos de outros donos
+    async with owner_locks.setdefault(owner.id, asyncio.Lock()):
+        async with onboarding_semaphore:
+            await configure_server(guild, owner)
+
+async def configure_server(guild: discord.Guild, owner: discord.Member) -> None:
+    guild_id = str(guild.id)
+    progress = onboarding.get(guild_id)
     text_channels = guild.text_channels
-    channel_options = "\n".join([f"{i+1}️⃣  #{channel.name}" for i, channel in enumerate(text_channels)])
-    embed_channel = discord.Embed(
-        title="📢 Configuração do Tchudozômetro",
-        description="Por favor, escolha o canal onde o bot enviará as enquetes diárias!",
-        color=discord.Color.blue()
-    )
-    embed_channel.add_field(name="📜 Opções disponíveis:", value=channel_options, inline=False)
-    embed_channel.set_footer(text="⏳ Responda com o número correspondente.")
-    await owner.send(embed=embed_channel)
 
     def check(m: discord.Message) -> bool:
-        return (m.author == owner and m.content.isdigit() and 1 <= int(m.content) <= len(text_channels))
-    try:
-        msg = await bot.wait_for('message', check=check, timeout=60)
-        channel_id = text_channels[int(msg.content) - 1].id
-    except asyncio.TimeoutError:
-        channel_id = text_channels[0].id
+        return (m.author.id == owner.id and m.content.isdigit() and 1 <= int(m.content) <= len(text_channels))
+
+    channel_id = progress.get("channel_id")
+    if channel_id is None:
+        msg = None
+        prompt_id = progress.get("channel_prompt_id")
+        if prompt_id is None:
+            channel_options = "\n".join([f"{i+1}️⃣  #{channel.name}" for i, channel in enumerate(text_channels)])
+            embed_channel = discord.Embed(
+                title="📢 Configuração do Tchudozômetro",
+                description="Por favor, escolha o canal onde o bot enviará as enquetes diárias!",
+                color=discord.Color.blue()
+            )
+            embed_channel.add_field(name="📜 Opções disponíveis:", value=channel_options, inline=False)
+            embed_channel.set_footer(text="⏳ Responda com o número correspondente.")
+            prompt = await owner.send(embed=embed_channel)
+            onboarding.update(guild_id, channel_prompt_id=prompt.id)
+        else:
+            # Retomando depois de reiniciar: a pergunta já foi enviada, não manda de novo
+            msg = await find_channel_reply(owner, prompt_id, check)
+        try:
+            msg = msg or await wait_for_owner_reply(owner.id, check, timeout=60)
+            channel_id = text_channels[int(msg.content) - 1].id
+        except asyncio.TimeoutError:
+            channel_id = text_channels[0].id
+        onboarding.update(guild_id, channel_id=channel_id)
 
     roles = [role for role in guild.roles if role.name != "@everyone"]
     if not roles:
@@ -299,9 +601,22 @@ async def setup_server(guild: discord.Guild) -> None:
         color=discord.Color.gold()
     )
     view = RoleSelectionView(roles, owner.id)
-    message = await owner.send(embed=embed_role, view=view)
+    message = None
+    role_prompt_id = progress.get("role_prompt_id")
+    if role_prompt_id is not None:
+        # Retomando depois de reiniciar: reaproveita a pergunta já enviada, só com botões novos
+        dm = owner.dm_channel or await owner.create_dm()
+        try:
+            message = await dm.get_partial_message(role_prompt_id).edit(embed=embed_role, view=view)
+        except discord.HTTPException:
+            message = None  # a mensagem foi apagada: pergunta de novo
+    if message is None:
+        message = await owner.send(embed=embed_role, view=view)
+        onboarding.update(guild_id, role_prompt_id=message.id)
     await view.wait()
     if view.selected_role is None:
+        # O canal escolhido fica salvo: na próxima inicialização só o cargo é perguntado, em uma DM nova
+        onboarding.update(guild_id, role_prompt_id=None)
         await message.edit(content="❌ Tempo esgotado! Nenhum cargo foi selecionado.", embed=None, view=None)
         return
 
@@ -310,9 +625,14 @@ async def setup_server(guild: discord.Guild) -> None:
         "channel_id": channel_id,
         "role_id": role_id,
         "min_call_time": 3600,
-        "weekly_required_time": 7200
+        "weekly_required_time": 7200,
+        "timezone": default_timezone(),
+        "poll_time": "07:00",
+        "summary_time": "23:00"
     }
-    save_server_settings(server_settings)
+    server_settings.save()
+    onboarding.finish(guild_id)
+    scheduler.schedule(guild_id)
     embed_confirm = discord.Embed(
         title="✅ Configuração concluída!",
         description="Tchudozômetro está pronto para começar!",
@@ -323,134 +643,311 @@ async def setup_server(guild: discord.Guild) -> None:
     embed_confirm.set_footer(text="🚀 O bot começará a enviar as enquetes diariamente às 07:00!")
     await owner.send(embed=embed_confirm)
 
-def next_run_time(hour: int, minute: int) -> float:
-    now = datetime.now()
-    next_run = datetime(now.year, now.month, now.day, hour, minute)
-    if now >= next_run:
-        next_run += timedelta(days=1)
-    return (next_run - now).total_seconds()
-
-@tasks.loop(hours=24)
-async def schedule_poll() -> None:
-    await asyncio.sleep(next_run_time(7, 0))
-    await daily_poll()
-
-@tasks.loop(hours=24)
-async def schedule_summary() -> None:
-    await asyncio.sleep(next_run_time(23, 0))
-    await daily_summary()
-
-async def daily_poll() -> None:
-    for guild_id, settings in server_settings.items():
+POLL_OPTIONS = {
+    "🟠": "EiTCHAAAAAAA",
+    "🔵": "OPA...",
+    "🟢": "TCHUDU BEM....",
+    "🔴": "FUI BUSCAR O CRACHÁ",
+}
+POLL_REACTIONS = list(POLL_OPTIONS)
+
+async def post_poll(channel: discord.TextChannel, guild_id: str, day: datetime) -> None:
+    embed = discord.Embed(
+        title="📢 Hoje é 'EITCHA' ou 'TCHUDU BEM'?",
+        description="Vote abaixo e registre sua presença! 🎮",
+        color=discord.Color.blue()
+    )
+    embed.add_field(name="🟠 EiTCHAAAAAAA", value="🔥 Fiquei mais de 1h!", inline=False)
+    embed.add_field(name="🔵 OPA...", value="👀 Ainda não sei...", inline=False)
+    embed.add_field(name="🟢 TCHUDU BEM....", value="💤 Passei menos de 1h na call...", inline=False)
+    embed.add_field(name="🔴 FUI BUSCAR O CRACHÁ", value="🚪 Não participei hoje.", inline=False)
+    embed.set_footer(text="📅 Vote antes da meia-noite!")
+    message = await dispatcher.call("send_message", channel.id, lambda: channel.send(embed=embed))
+    poll_tally.register(message.id, guild_id, period_key(DAY, day))
+    # As reações continuam em sequência para manter a ordem na mensagem
+    for reaction in POLL_REACTIONS:
+        await dispatcher.call("add_reaction", channel.id, lambda r=reaction: message.add_reaction(r))
+
+async def daily_poll(batch: list[tuple[str, datetime]]) -> None:
+    jobs = {}
+    for guild_id, due in batch:
         channel = get_channel(bot, guild_id)
         if channel:
-            embed = discord.Embed(
-                title="📢 Hoje é 'EITCHA' ou 'TCHUDU BEM'?",
-                description="Vote abaixo e registre sua presença! 🎮",
-                color=discord.Color.blue()
-            )
-            embed.add_field(name="🟠 EiTCHAAAAAAA", value="🔥 Fiquei mais de 1h!", inline=False)
-            embed.add_field(name="🔵 OPA...", value="👀 Ainda não sei...", inline=False)
-            embed.add_field(name="🟢 TCHUDU BEM....", value="💤 Passei menos de 1h na call...", inline=False)
-            embed.add_field(name="🔴 FUI BUSCAR O CRACHÁ", value="🚪 Não participei hoje.", inline=False)
-            embed.set_footer(text="📅 Vote antes da meia-noite!")
-            message = await channel.send(embed=embed)
-            for reaction in ["🟠", "🔵", "🟢", "🔴"]:
-                await message.add_reaction(reaction)
-
-async def daily_summary() -> None:
-    for guild_id, settings in server_settings.items():
+            jobs[guild_id] = post_poll(channel, guild_id, due)
+    await dispatcher.broadcast("daily_poll", jobs)
+
+async def post_summary(channel: discord.TextChannel, guild_id: str, day: datetime) -> None:
+    today = rollups.totals(guild_id, DAY, day)
+    eitcha_count = sum(1 for time_val in today.values() if time_val >= 3600)
+    tchudu_bem_count = sum(1 for time_val in today.values() if 0 < time_val < 3600)
+    embed = discord.Embed(
+        title="📊 **Resumo do Dia**",
+        description="Aqui está o desempenho de hoje! ⏳",
+        color=discord.Color.green()
+    )
+    embed.add_field(name="🔥 EiTCHAAAAAAA", value=f"🏆 {eitcha_count} jogadores ficaram mais de 1h!", inline=False)
+    embed.add_field(name="😴 TCHUDU BEM.... (;-;)", value=f"💤 {tchudu_bem_count} passaram menos de 1h.", inline=False)
+    votes = poll_tally.results(guild_id, period_key(DAY, day))
+    if votes:
+        embed.add_field(
+            name="🗳️ Enquete de hoje",
+            value="\n".join(f"{emoji} {label}: **{votes.get(emoji, 0)}**" for emoji, label in POLL_OPTIONS.items()),
+            inline=False,
+        )
+    embed.set_footer(text="📅 Estatísticas atualizadas diariamente às 23:00.")
+    await dispatcher.call("send_message", channel.id, lambda: channel.send(embed=embed))
+
+async def daily_summary(batch: list[tuple[str, datetime]]) -> None:
+    jobs = {}
+    for guild_id, due in batch:
         channel = get_channel(bot, guild_id)
         if channel:
-            time_data = { uid: t for uid, t in user_data.get(guild_id, {}).items() if uid.startswith("time_") }
-            eitcha_count = sum(1 for _, time_val in time_data.items() if time_val >= 3600)
-            tchudu_bem_count = sum(1 for _, time_val in time_data.items() if 0 < time_val < 3600)
-            embed = discord.Embed(
-                title="📊 **Resumo do Dia**",
-                description="Aqui está o desempenho de hoje! ⏳",
-                color=discord.Color.green()
-            )
-            embed.add_field(name="🔥 EiTCHAAAAAAA", value=f"🏆 {eitcha_count} jogadores ficaram mais de 1h!", inline=False)
-            embed.add_field(name="😴 TCHUDU BEM.... (;-;)", value=f"💤 {tchudu_bem_count} passaram menos de 1h.", inline=False)
-            embed.set_footer(text="📅 Estatísticas atualizadas diariamente às 23:00.")
-            await channel.send(embed=embed)
-
-@tasks.loop(hours=24)
-async def award_tchudu_master() -> None:
-    now = datetime.now()
-    if now.day != 1:
+            jobs[guild_id] = post_summary(channel, guild_id, due)
+    await dispatcher.broadcast("daily_summary", jobs)
+
+async def other_holders(guild: discord.Guild, role: discord.Role, winner: discord.Member) -> list[discord.Member]:
+    """Quem tem o cargo, fora o vencedor.
+
+    Com o último vencedor salvo (master_id) basta conferir ele, se a contagem de
+    membros do cargo (uma chamada REST) confirmar que não há mais ninguém. Cargo dado
+    à mão, servidor sem master_id ou contagem indisponível caem na lista completa:
+    role.members confere o cargo de cada membro em cache (no modo enxuto a lista de
+    membros é baixada só agora).
+    """
+    master_id = server_settings.get(guild.id, {}).get("master_id")
+    role_member_counts = getattr(guild, "role_member_counts", None)  # discord.py 2.7+
+    if master_id is not None and role_member_counts is not None:
+        previous = await find_member(guild, master_id) if int(master_id) != winner.id else None
+        known = [m for m in (previous, winner) if m is not None and m.get_role(role.id) is not None]
+        try:
+            counts = await dispatcher.call("role_member_counts", guild.id, role_member_counts)
+        except discord.HTTPException:
+            counts = None
+        if counts is not None and counts.get(role, 0) <= len(known):
+            return [m for m in known if m.id != winner.id]
+    return [m for m in await role_holders(guild, role) if m.id != winner.id]
+
+async def award_guild(guild: discord.Guild, role: discord.Role, user_id: str, winners: dict[str, int]) -> None:
+    member = await find_member(guild, user_id)
+    if not member:
         return
-    for guild_id, settings in server_settings.items():
-        if guild_id not in user_data:
-            continue
-        time_data = { uid: t for uid, t in user_data[guild_id].items() if uid.startswith("time_") }
-        if not time_data:
+    holders = await other_holders(guild, role, member)
+    await asyncio.gather(*(
+        dispatcher.call("member_roles", guild.id, lambda m=m: m.remove_roles(role))
+        for m in holders
+    ))
+    if role not in member.roles:
+        await dispatcher.call("member_roles", guild.id, lambda: member.add_roles(role))
+    embed = discord.Embed(
+        title="🏅 Novo Tchudu Bem Master!",
+        description=f"😱 {member.mention} ficou com **menos tempo em call** no último mês!",
+        color=discord.Color.red()
+    )
+    embed.set_footer(text="Tente se redimir no próximo mês... 😂")
+    winners[str(guild.id)] = member.id
+    channel = get_channel(bot, guild.id)
+    if channel:
+        await dispatcher.call("send_message", channel.id, lambda: channel.send(embed=embed))
+
+async def award_tchudu_master(batch: list[tuple[str, datetime]]) -> None:
+    jobs = {}
+    winners: dict[str, int] = {}  # guild_id -> quem recebeu o cargo
+    for guild_id, due in batch:
+        if guild_id not in server_settings:
             continue
-        min_user = min(time_data, key=time_data.get, default=None)
+        last_month = due.replace(day=1) - timedelta(days=1)
+        min_user = rollups.month_minimum(guild_id, last_month)
         if not min_user:
             continue
-        actual_min_user_id = min_user[5:]
+        actual_min_user_id = min_user[0]
         guild = bot.get_guild(int(guild_id))
         if not guild:
             continue
-        role = guild.get_role(settings["role_id"])
+        role = guild.get_role(server_settings.role_id(guild_id))
         if not role:
             continue
-        member = guild.get_member(int(actual_min_user_id))
-        if not member:
-            continue
-        for m in guild.members:
-            if role in m.roles:
-                await m.remove_roles(role)
-        await member.add_roles(role)
-        embed = discord.Embed(
-            title="🏅 Novo Tchudu Bem Master!",
-            description=f"😱 {member.mention} ficou com **menos tempo em call** este mês!",
-            color=discord.Color.red()
-        )
-        embed.set_footer(text="Tente se redimir no próximo mês... 😂")
+        jobs[guild_id] = award_guild(guild, role, actual_min_user_id, winners)
+    report = await dispatcher.broadcast("award_tchudu_master", jobs)
+    if winners:
+        # Guarda o novo dono do cargo: no próximo mês, se ninguém mais tiver o cargo, só ele é conferido
+        server_settings.set_many({
+            guild_id: dict(server_settings[guild_id], master_id=user_id)
+            for guild_id, user_id in winners.items() if guild_id in server_settings
+        })
+        server_settings.save()
+    for guild_id, seconds in sorted(report.durations.items(), key=lambda item: item[1], reverse=True)[:5]:
+        print(f"   🏅 servidor {guild_id}: prêmio entregue em {seconds:.2f}s")
+
+def daily_at(field: str, default: str):
+    """Horário diário configurável por servidor, no fuso do servidor."""
+    def when(guild_id: str):
+        hour, minute = server_settings.time_of_day(guild_id, field, default)
+        return hour, minute, server_settings.timezone(guild_id), None
+    return when
+
+scheduler.register("daily_poll", daily_poll, daily_at("poll_time", "07:00"), max_lateness=timedelta(hours=5))
+scheduler.register("daily_summary", daily_summary, daily_at("summary_time", "23:00"), max_lateness=timedelta(minutes=55))
+scheduler.register(
+    "award_tchudu_master", award_tchudu_master,
+    lambda guild_id: (0, 5, server_settings.timezone(guild_id), 1),  # dia 1, 00:05
+    max_lateness=timedelta(days=7),
+)
+
+def reschedule_changed(guild_ids: set[str]) -> None:
+    """Horário ou fuso editados no arquivo: reagenda já, sem esperar o disparo no horário antigo."""
+    for guild_id in guild_ids:
+        if guild_id in server_settings:
+            scheduler.schedule(guild_id, force=True)
+        else:
+            scheduler.unschedule(guild_id)
+
+server_settings.add_reload_hook(reschedule_changed)
+
+@bot.event
+async def on_raw_reaction_add(payload: discord.RawReactionActionEvent) -> None:
+    # Eventos "raw" chegam mesmo sem a mensagem no cache; as reações do próprio bot não são votos
+    if payload.guild_id and payload.user_id != bot.user.id and str(payload.emoji) in POLL_OPTIONS:
+        poll_tally.react(payload.message_id, str(payload.emoji), 1)
+
+@bot.event
+async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent) -> None:
+    if payload.guild_id and payload.user_id != bot.user.id and str(payload.emoji) in POLL_OPTIONS:
+        poll_tally.react(payload.message_id, str(payload.emoji), -1)
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel) -> None:
+    if server_settings.channel_id(channel.guild.id) == channel.id:
+        server_settings.forget_channel(channel.guild.id)
+
+# Créditos aplicados entre uma devolução e outra do loop no session_ticker
+CREDIT_CHUNK = 2000
+
+def group_by_guild(credits: list[Credit]) -> dict[str, list[Credit]]:
+    by_guild: dict[str, list[Credit]] = {}
+    for credit in credits:
+        by_guild.setdefault(credit.guild_id, []).append(credit)
+    return by_guild
+
+def credit_guild(guild_id: str, credits: list[Credit], tz, level_ups: dict[str, list[tuple[str, int]]]) -> None:
+    """Soma tempo e XP dos créditos de um servidor; GuildStats, fuso e buckets buscados uma vez."""
+    stats = guild_stats(guild_id)
+    for credit in credits:
+        user_id = credit.user_id
+        stats.add(user_id, "time", credit.seconds)
+        xp_atual = stats.add(user_id, "xp", credit.xp)
+        nivel_atual = xp_atual // 100
+        if nivel_atual > stats.get(user_id, "nivel"):
+            stats.set(user_id, "nivel", nivel_atual)
+            level_ups.setdefault(guild_id, []).append((user_id, nivel_atual))
+    rollups.add_many(guild_id, [(credit.user_id, credit.start, credit.end) for credit in credits], tz)
+    user_store.mark_dirty(guild_id, *(credit.user_id for credit in credits))
+
+def apply_credits(credits: list[Credit]) -> dict[str, list[tuple[str, int]]]:
+    """Soma tempo e XP dos créditos em lote; retorna quem subiu de nível, por servidor."""
+    level_ups: dict[str, list[tuple[str, int]]] = {}
+    for guild_id, guild_credits in group_by_guild(credits).items():
+        credit_guild(guild_id, guild_credits, server_settings.timezone(guild_id), level_ups)
+    return level_ups
+
+async def apply_credits_chunked(credits: list[Credit]) -> dict[str, list[tuple[str, int]]]:
+    """Como apply_credits, mas devolvendo o loop a cada CREDIT_CHUNK créditos."""
+    level_ups: dict[str, list[tuple[str, int]]] = {}
+    pending = 0
+    for guild_id, guild_credits in group_by_guild(credits).items():
+        tz = server_settings.timezone(guild_id)
+        for i in range(0, len(guild_credits), CREDIT_CHUNK):
+            chunk = guild_credits[i:i + CREDIT_CHUNK]
+            credit_guild(guild_id, chunk, tz, level_ups)
+            pending += len(chunk)
+            if pending >= CREDIT_CHUNK:
+                pending = 0
+                await asyncio.sleep(0)  # eventos de voz e comandos não esperam o tick inteiro
+    return level_ups
+
+async def announce_level_ups(level_ups: dict[str, list[tuple[str, int]]]) -> None:
+    """Um único embed por canal com todo mundo que subiu de nível no mesmo lote."""
+    async def announce(guild_id: str, ups: list[tuple[str, int]]) -> None:
         channel = get_channel(bot, guild_id)
-        if channel:
-            await channel.send(embed=embed)
+        if not channel:
+            return
+        if len(ups) == 1:
+            user_id, nivel = ups[0]
+            description = f"Parabéns <@{user_id}>, você agora é **Nível {nivel}**!"
+        else:
+            description = "Parabéns!\n" + "\n".join(f"<@{user_id}> agora é **Nível {nivel}**" for user_id, nivel in ups)
+        embed = discord.Embed(title="🎉 Subiu de nível!", description=description, color=discord.Color.green())
+        await dispatcher.call("send_message", channel.id, lambda: channel.send(embed=embed))
+
+    results = await asyncio.gather(*(announce(g, ups) for g, ups in level_ups.items()), return_exceptions=True)
+    for error in results:
+        if isinstance(error, Exception):
+            print(f"❌ Erro ao anunciar nível: {error}")
+
+@tasks.loop(seconds=SESSION_TICK_SECONDS)
+async def session_ticker() -> None:
+    """Credita tempo e XP de todo mundo que está em call, numa passada só."""
+    credits = active_sessions.tick(datetime.now(timezone.utc).timestamp())
+    level_ups = await apply_credits_chunked(credits)
+    if level_ups:
+        await announce_level_ups(level_ups)
 
 @bot.event
+@metrics.timed("voice_state_update_seconds")
 async def on_voice_state_update(member: discord.Member, before: discord.VoiceState, after: discord.VoiceState) -> None:
     guild_id = str(member.guild.id)
     user_id = str(member.id)
+    now = datetime.now(timezone.utc).timestamp()
+    credit = None
     if after.channel and not before.channel:
-        user_data.setdefault(guild_id, {})[f"join_{user_id}"] = datetime.utcnow().timestamp()
+        active_sessions.start(guild_id, user_id, after.channel.id, now, paused=is_idle(after))
+        session_log.join(guild_id, user_id, after.channel.id, now)
     elif before.channel and not after.channel:
-        join_key = f"join_{user_id}"
-        join_time = user_data[guild_id].pop(join_key, None)
-        if join_time:
-            duration = datetime.utcnow().timestamp() - join_time
-            time_key = f"time_{user_id}"
-            total_time = user_data[guild_id].get(time_key, 0) + duration
-            user_data[guild_id][time_key] = total_time
-            xp_ganho = int(duration // 600) * 10
-            xp_key = f"xp_{user_id}"
-            xp_atual = user_data[guild_id].get(xp_key, 0) + xp_ganho
-            user_data[guild_id][xp_key] = xp_atual
-            nivel_key = f"nivel_{user_id}"
-            nivel_anterior = user_data[guild_id].get(nivel_key, 0)
-            nivel_atual = xp_atual // 100
-            if nivel_atual > nivel_anterior:
-                user_data[guild_id][nivel_key] = nivel_atual
-                embed = discord.Embed(
-                    title="🎉 Subiu de nível!",
-                    description=f"Parabéns {member.mention}, você agora é **Nível {nivel_atual}**!",
-                    color=discord.Color.green()
-                )
-                channel = get_channel(bot, guild_id)
-                if channel:
-                    await channel.send(embed=embed)
-            save_user_data(user_data)
+        session_log.leave(guild_id, user_id, before.channel.id, now)
+        credit = active_sessions.stop(guild_id, user_id, now)
+    elif before.channel and after.channel:
+        if before.channel != after.channel:
+            session_log.move(guild_id, user_id, after.channel.id, now)
+        if before.channel != after.channel or is_idle(before) != is_idle(after):
+            credit = active_sessions.update(guild_id, user_id, after.channel.id, is_idle(after), now)
+    if credit:
+        level_ups = apply_credits([credit])
+        if level_ups:
+            await announce_level_ups(level_ups)
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command) -> None:
+    record_command(interaction, command, "ok")
+
+@bot.event
+async def on_socket_event_type(event_type: str) -> None:
+    gateway_stats.record(event_type)
+
+@tasks.loop(seconds=60)
+async def gateway_report() -> None:
+    print(gateway_stats.report(bot, "enxuto" if LEAN_GATEWAY else "normal"))
+
+@bot.event
+async def setup_hook() -> None:
+    # systemd/docker param o bot com SIGTERM, que o bot.run() não trata: sem isto o
+    # processo morre sem passar pelo finally abaixo e perde a última gravação
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+    except NotImplementedError:
+        pass  # Windows: sem add_signal_handler
 
 # ============================================================
 #                       INICIAR O BOT
 # ============================================================
 
 if TOKEN:
-    bot.run(TOKEN)
+    user_store.start()
+    try:
+        bot.run(TOKEN)
+    finally:
+        try:
+            # Primeiro para a thread de gravação (que também compacta o log) e grava o que falta
+            user_store.close()
+        finally:
+            session_log.close()
 else:
     print("Erro: DISCORD_TOKEN não foi encontrado no .env")
@@ -0,0 +1,127 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+
+def _parse_ids(text):
+    """'0,1,4-7' -> [0, 1, 4, 5, 6, 7]"""
+    ids = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            ids.extend(range(int(first), int(last) + 1))
+        else:
+            ids.append(int(part))
+    return sorted(set(ids))
+
+class ClusterConfig:
+    """Quais shards do Discord este processo atende.
+
+    Sem SHARD_COUNT o bot roda como sempre, um processo com tudo. Com SHARD_COUNT o
+    bot vira `AutoShardedBot`; com SHARD_IDS também, cada processo fica só com uma
+    parte dos shards (modo cluster). Nesse modo todo estado por servidor (configurações,
+    estatísticas, rollups, agendador, votações) fica no SQLite, pelo guild_id; só o que
+    é do próprio processo (o log de sessões de voz) ganha uma pasta por processo.
+    """
+    def __init__(self, shard_count=None, shard_ids=None):
+        if shard_ids is not None and shard_count is None:
+            raise ValueError("SHARD_IDS exige SHARD_COUNT")
+        if shard_ids is not None and any(not 0 <= s < shard_count for s in shard_ids):
+            raise ValueError(f"SHARD_IDS fora do intervalo 0..{shard_count - 1}: {shard_ids}")
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids
+
+    @classmethod
+    def from_env(cls):
+        count = os.getenv("SHARD_COUNT")
+        ids = os.getenv("SHARD_IDS")
+        return cls(int(count) if count else None, _parse_ids(ids) if ids else None)
+
+    @property
+    def sharded(self):
+        return self.shard_count is not None
+
+    @property
+    def multi_process(self):
+        """Outros processos atendem o resto dos shards."""
+        return self.shard_ids is not None and len(self.shard_ids) < self.shard_count
+
+    @property
+    def name(self):
+        if not self.multi_process:
+            return "único"
+        return "shards " + ",".join(map(str, self.shard_ids))
+
+    def shard_of(self, guild_id):
+        """Fórmula do Discord: (guild_id >> 22) % shard_count."""
+        return (int(guild_id) >> 22) % self.shard_count
+
+    def owns(self, guild_id):
+        """Se os eventos e as tarefas deste servidor são deste processo."""
+        if not self.multi_process:
+            return True
+        return self.shard_of(guild_id) in self.shard_ids
+
+    @property
+    def syncs_commands(self):
+        """Os comandos slash são globais: só o processo do shard 0 sincroniza."""
+        return not self.multi_process or 0 in self.shard_ids
+
+    def bot_options(self):
+        if not self.sharded:
+            return {}
+        return {"shard_count": self.shard_count, "shard_ids": self.shard_ids}
+
+    def data_path(self, path):
+        """Caminho de um arquivo só deste processo (ex.: o log de sessões de voz).
+
+        No modo cluster vira `data/cluster-0-1/arquivo`; na primeira vez o arquivo é
+        copiado do caminho original (se existir), para não perder o que havia antes
+        de dividir o bot. Estado por servidor não vai aqui: fica no SQLite.
+        """
+        if not self.multi_process:
+            return path
+        directory, name = os.path.split(path)
+        cluster_dir = os.path.join(directory, "cluster-" + "-".join(map(str, self.shard_ids)))
+        os.makedirs(cluster_dir, exist_ok=True)
+        target = os.path.join(cluster_dir, name)
+        if not os.path.exists(target) and os.path.exists(path):
+            shutil.copyfile(path, target)
+        return target
+
+def launch(shard_count, processes, script="bot.py"):
+    """Sobe `processes` cópias do bot, dividindo os shards entre elas, e espera todas."""
+    processes = min(processes, shard_count)
+    groups = [list(range(shard_count))[i::processes] for i in range(processes)]
+    children = []
+    for shard_ids in groups:
+        env = dict(os.environ, SHARD_COUNT=str(shard_count), SHARD_IDS=",".join(map(str, shard_ids)))
+        # Sessão própria: o Ctrl+C do terminal chega só ao lançador, que repassa uma vez
+        # (um segundo SIGINT cairia no meio da gravação final do processo)
+        children.append(subprocess.Popen([sys.executable, script], env=env, start_new_session=True))
+        print(f"🚀 Processo {children[-1].pid}: shards {shard_ids}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        for child in children:
+            child.send_signal(signal.SIGTERM)  # o bot fecha e grava o que falta
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    return max(child.wait() for child in children)
+
+if __name__ == "__main__":
+    # python -m utils.cluster <shards> <processos>
+    if len(sys.argv) != 3:
+        print("Uso: python -m utils.cluster <shards> <processos>")
+        sys.exit(1)
+    sys.exit(launch(int(sys.argv[1]), int(sys.argv[2])))
@@ -1,25 +1,890 @@
+import contextlib
+import heapq
+import itertools
 import json
 import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections.abc import MutableMapping
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from utils.guild_stats import GuildStats, METRICS
+from utils.metrics import metrics
+
+metrics.counter("file_write_bytes_total", "Bytes gravados em arquivos de estado (JSON/log), por arquivo")
+metrics.histogram("file_write_seconds", "Duração da gravação atômica de um arquivo de estado")
+metrics.histogram("storage_flush_seconds", "Duração de uma gravação do user_data ou do server_settings")
+metrics.counter("storage_guilds_written_total", "Servidores gravados pelo UserDataStore")
+metrics.counter("sqlite_rows_written_total", "Linhas inseridas/alteradas/apagadas no SQLite")
 
 CONFIG_FILE = "data/server_settings.json"
 USER_DATA_FILE = "data/user_data.json"
 
+def atomic_write(path, text):
+    """Grava em um arquivo temporário e renomeia, para um crash nunca deixar o JSON truncado.
+
+    `text` pode ser uma string ou um iterável de pedaços, gravados em sequência.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            for piece in ((text,) if isinstance(text, str) else text):
+                f.write(piece)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    name = os.path.basename(path)
+    metrics.inc("file_write_bytes_total", size, file=name)
+    metrics.observe("file_write_seconds", time.perf_counter() - start, file=name)
+
+def join_fragments(fragments):
+    """Objeto JSON a partir de {chave: JSON já serializado do valor}, sem serializar de novo."""
+    body = ",\n".join(f"{json.dumps(key)}: {fragment}" for key, fragment in fragments.items())
+    return "{\n" + body + "\n}"
+
+def load_guild_state(backend, kind, path, file_rows, owns=None):
+    """Linhas (guild_id, chave, valor) do estado por servidor `kind`.
+
+    Sem backend vêm do arquivo JSON `path` (convertido por `file_rows`). Com o SQLite
+    vêm da tabela guild_state, só dos servidores em que `owns(guild_id)`; o arquivo,
+    se existir, é importado para o banco na primeira vez.
+    """
+    def read_file():
+        with open(path, "r") as f:
+            return file_rows(json.load(f))
+
+    if backend is None:
+        return read_file() if os.path.exists(path) else []
+    if os.path.exists(path):
+        backend.import_guild_state(kind, read_file)
+    return backend.load_guild_state(kind, owns)
+
+class WriteBehindFile:
+    """Base do estado por servidor gravado pela thread do UserDataStore.
+
+    O loop de eventos altera o estado e marca o que mudou com `_mark()`. `flush()`
+    (registrado com `add_flush_hook`) grava com `atomic_write` o texto de
+    `_serialize()` ou, com `backend` (SQLite, compartilhado entre os processos do modo
+    cluster), só as linhas de `_rows()`. Se a gravação falhar, o que estava sujo volta
+    para a próxima tentativa.
+
+    Subclasses definem `KIND` (nome do estado no banco), `_file_rows()` (JSON do
+    arquivo -> linhas), `_load_rows()` (linhas -> estado em memória), `_rows()` e
+    `_serialize()`.
+    """
+    KIND = None
+
+    def __init__(self, path, backend=None, owns=None):
+        self.path = path
+        self.backend = backend
+        self.owns = owns  # modo cluster: carrega só os servidores deste processo
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _mark(self, *keys):
+        with self._lock:
+            self._dirty.update(keys)
+
+    def _take_dirty(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def _restore_dirty(self, dirty):
+        with self._lock:
+            self._dirty |= dirty
+
+    def _file_rows(self, data):
+        raise NotImplementedError
+
+    def _load_rows(self, rows):
+        raise NotImplementedError
+
+    def _rows(self, dirty):
+        """[(guild_id, chave, valor ou None para apagar)] das linhas em `dirty`."""
+        raise NotImplementedError
+
+    def _serialize(self, dirty):
+        """Texto do arquivo. Roda na thread de gravação: copie o estado com list()/dict(),
+        que copiam de uma vez, sem competir com o loop de eventos."""
+        raise NotImplementedError
+
+    def load(self):
+        self._load_rows(load_guild_state(self.backend, self.KIND, self.path, self._file_rows, self.owns))
+
+    def flush(self):
+        """Grava se houver alterações. Retorna True se algo foi escrito."""
+        dirty = self._take_dirty()
+        if not dirty:
+            return False
+        try:
+            if self.backend is not None:
+                self.backend.write_guild_state(self.KIND, self._rows(dirty))
+            else:
+                atomic_write(self.path, self._serialize(dirty))
+        except BaseException:
+            self._restore_dirty(dirty)
+            raise
+        return True
+
+SQLITE_FILE = "data/tchudozometro.db"
+
+def default_timezone():
+    """Fuso padrão (DEFAULT_TIMEZONE), lido na hora: o bot só carrega o .env depois dos imports."""
+    return os.getenv("DEFAULT_TIMEZONE", "America/Sao_Paulo")
+
+def _split_key(key):
+    """'choque_dado_123' -> ('choque_dado', '123')."""
+    metric, _, user_id = key.rpartition("_")
+    return metric, user_id
+
+class JsonBackend:
+    """Backend original: user_data.json e server_settings.json inteiros em disco."""
+    indexed = False
+
+    def __init__(self, config_file=CONFIG_FILE, user_data_file=USER_DATA_FILE):
+        self.config_file = config_file
+        self.user_data_file = user_data_file
+        self._fragments = {}  # guild_id -> JSON da última gravação
+
+    def load_server_settings(self):
+        if os.path.exists(self.config_file):
+            with open(self.config_file, "r") as f:
+                return json.load(f)
+        return {}
+
+    def save_server_settings(self, data, changed=None):
+        # `changed` não ajuda aqui: o arquivo é sempre regravado inteiro
+        atomic_write(self.config_file, json.dumps(data, indent=4))
+
+    def load_user_data(self):
+        if os.path.exists(self.user_data_file):
+            with open(self.user_data_file, "r") as f:
+                return json.load(f)
+        return {}
+
+    def save_user_data(self, data):
+        data = {gid: g.to_dict() if isinstance(g, GuildStats) else g for gid, g in data.items()}
+        atomic_write(self.user_data_file, json.dumps(data, separators=(",", ":")))
+        self._fragments.clear()
+
+    def write_guilds(self, data, dirty):
+        """Grava só os servidores alterados; os demais reaproveitam o JSON anterior."""
+        guild_ids = list(data)  # list()/dict() copiam de uma vez, sem competir com o loop
+        missing = [gid for gid in guild_ids if gid not in self._fragments]
+        removed = [gid for gid in self._fragments if gid not in data]
+        if not dirty and not missing and not removed:
+            return False
+        for gid in set(dirty).union(missing):
+            guild = data.get(gid)
+            if guild is None:
+                self._fragments.pop(gid, None)
+            else:
+                self._fragments[gid] = json.dumps(guild.to_dict(), separators=(",", ":"))
+        for gid in removed:
+            self._fragments.pop(gid, None)
+        atomic_write(self.user_data_file, join_fragments(self._fragments))
+        return True
+
+class SqliteBackend:
+    """Backend SQLite (WAL) com uma linha por (servidor, usuário, métrica).
+
+    O índice em (guild_id, metric, value) deixa o ranking geral como uma consulta
+    indexada em vez de varrer todas as chaves do servidor em Python. O resto do estado
+    por servidor (rollups, agendador, votações, onboarding) fica em guild_state, uma
+    linha JSON por (tipo, servidor, chave), para qualquer processo do modo cluster
+    achar o estado de um servidor que passou a ser dele.
+    """
+    indexed = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            guild_id TEXT NOT NULL,
+            user_id  TEXT NOT NULL,
+            metric   TEXT NOT NULL,
+            value    NUMERIC NOT NULL,
+            PRIMARY KEY (guild_id, user_id, metric)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_user_stats_metric ON user_stats (guild_id, metric, value);
+        CREATE TABLE IF NOT EXISTS server_settings (
+            guild_id TEXT PRIMARY KEY,
+            settings TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS guild_state (
+            kind     TEXT NOT NULL,
+            guild_id TEXT NOT NULL,
+            key      TEXT NOT NULL,
+            value    TEXT NOT NULL,
+            PRIMARY KEY (kind, guild_id, key)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS imported_files (
+            kind TEXT PRIMARY KEY
+        );
+    """
+    UPSERT = ("INSERT INTO user_stats (guild_id, user_id, metric, value) VALUES (?, ?, ?, ?) "
+              "ON CONFLICT (guild_id, user_id, metric) DO UPDATE SET value = excluded.value")
+    DELETE = "DELETE FROM user_stats WHERE guild_id = ? AND user_id = ? AND metric = ?"
+    UPSERT_STATE = ("INSERT INTO guild_state (kind, guild_id, key, value) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (kind, guild_id, key) DO UPDATE SET value = excluded.value")
+    DELETE_STATE = "DELETE FROM guild_state WHERE kind = ? AND guild_id = ? AND key = ?"
+
+    def __init__(self, path=SQLITE_FILE):
+        self.path = path
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # Uma conexão para escrita (thread de gravação) e outra para consultas (loop);
+        # com WAL as leituras não esperam a gravação terminar.
+        self._writer = self._connect()
+        self._writer.executescript(self.SCHEMA)
+        self._reader = self._connect()
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")  # no modo cluster outros processos gravam no mesmo banco
+        return conn
+
+    def load_server_settings(self):
+        with self._read_lock:
+            rows = self._reader.execute("SELECT guild_id, settings FROM server_settings").fetchall()
+        return {guild_id: json.loads(settings) for guild_id, settings in rows}
+
+    def save_server_settings(self, data, changed=None):
+        """Regrava tudo, ou só os servidores em `changed` (sem apagar os de outros processos)."""
+        if changed is None:
+            rows = [(guild_id, json.dumps(settings)) for guild_id, settings in data.items()]
+            with self._write_lock:
+                with self._writer:
+                    self._writer.execute("BEGIN")
+                    self._writer.execute("DELETE FROM server_settings")
+                    self._writer.executemany("INSERT INTO server_settings (guild_id, settings) VALUES (?, ?)", rows)
+            return
+        rows = [(guild_id, json.dumps(data[guild_id])) for guild_id in changed if guild_id in data]
+        removed = [(guild_id,) for guild_id in changed if guild_id not in data]
+        with self._write_lock:
+            with self._writer:
+                self._writer.execute("BEGIN")
+                self._writer.executemany("DELETE FROM server_settings WHERE guild_id = ?", removed)
+                self._writer.executemany(
+                    "INSERT INTO server_settings (guild_id, settings) VALUES (?, ?) "
+                    "ON CONFLICT (guild_id) DO UPDATE SET settings = excluded.settings",
+                    rows,
+                )
+
+    def load_user_data(self):
+        data = {}
+        with self._read_lock:
+            rows = self._reader.execute("SELECT guild_id, user_id, metric, value FROM user_stats")
+            for guild_id, user_id, metric, value in rows:
+                data.setdefault(guild_id, {})[f"{metric}_{user_id}"] = value
+        return data
+
+    def save_user_data(self, data):
+        """`data` no formato de load_user_data (colunar ou com chaves "<métrica>_<id>")."""
+        rows = []
+        for gid, guild in data.items():
+            for key, value in GuildStats.from_dict(guild).to_legacy().items():
+                metric, user_id = _split_key(key)
+                rows.append((gid, user_id, metric, value))
+        with self._write_lock:
+            with self._writer:
+                self._writer.execute("BEGIN")
+                self._writer.execute("DELETE FROM user_stats")
+                self._writer.executemany(self.UPSERT, rows)
+
+    def write_guilds(self, data, dirty):
+        """`dirty` mapeia guild_id -> usuários alterados (None = servidor inteiro)."""
+        if not dirty:
+            return False
+        upserts, deletes, wiped = [], [], []
+        for gid, user_ids in dirty.items():
+            guild = data.get(gid)
+            if guild is None or user_ids is None:
+                wiped.append((gid,))
+                user_ids = list(guild.ids) if guild is not None else []
+            for user_id in user_ids:
+                for metric in METRICS:
+                    value = guild.get(user_id, metric)
+                    if value:
+                        upserts.append((gid, str(user_id), metric, value))
+                    else:
+                        deletes.append((gid, str(user_id), metric))
+        with self._write_lock:
+            with self._writer:
+                self._writer.execute("BEGIN")
+                self._writer.executemany("DELETE FROM user_stats WHERE guild_id = ?", wiped)
+                self._writer.executemany(self.DELETE, deletes)
+                self._writer.executemany(self.UPSERT, upserts)
+        metrics.inc("sqlite_rows_written_total", len(wiped) + len(deletes) + len(upserts), table="user_stats")
+        return True
+
+    def top_users(self, guild_id, metric, limit=10, ascending=False):
+        order = "ASC" if ascending else "DESC"
+        with self._read_lock:
+            return self._reader.execute(
+                f"SELECT user_id, value FROM user_stats WHERE guild_id = ? AND metric = ? "
+                f"ORDER BY value {order} LIMIT ?",
+                (str(guild_id), metric, limit),
+            ).fetchall()
+
+    def load_guild_state(self, kind, owns=None):
+        """[(guild_id, chave, valor)] do estado `kind`, só dos servidores em que `owns(guild_id)`."""
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT guild_id, key, value FROM guild_state WHERE kind = ?", (kind,)
+            ).fetchall()
+        return [(guild_id, key, json.loads(value)) for guild_id, key, value in rows
+                if owns is None or owns(guild_id)]
+
+    def _write_state_rows(self, kind, rows):
+        upserts = [(kind, str(guild_id), key, json.dumps(value)) for guild_id, key, value in rows if value is not None]
+        deletes = [(kind, str(guild_id), key) for guild_id, key, value in rows if value is None]
+        self._writer.executemany(self.DELETE_STATE, deletes)
+        self._writer.executemany(self.UPSERT_STATE, upserts)
+        metrics.inc("sqlite_rows_written_total", len(rows), table="guild_state")
+
+    def write_guild_state(self, kind, rows):
+        """Grava as linhas (guild_id, chave, valor); valor None apaga a linha."""
+        if not rows:
+            return
+        with self._write_lock:
+            with self._writer:
+                self._writer.execute("BEGIN")
+                self._write_state_rows(kind, rows)
+
+    def import_guild_state(self, kind, read_rows):
+        """Copia para o banco as linhas do arquivo antigo de `kind`, uma vez só.
+
+        BEGIN IMMEDIATE faz os outros processos do cluster esperarem a importação
+        terminar; depois dela o arquivo é ignorado. Retorna True se importou agora.
+        """
+        with self._write_lock:
+            with self._writer:
+                self._writer.execute("BEGIN IMMEDIATE")
+                if self._writer.execute("SELECT 1 FROM imported_files WHERE kind = ?", (kind,)).fetchone():
+                    return False
+                self._write_state_rows(kind, read_rows())
+                self._writer.execute("INSERT INTO imported_files (kind) VALUES (?)", (kind,))
+        print(f"📥 {kind}: arquivo antigo importado para o SQLite.")
+        return True
+
+    def close(self):
+        self._writer.close()
+        self._reader.close()
+
+def create_backend(name=None):
+    """Cria o backend pelo nome ('json' ou 'sqlite'); padrão vem de STORAGE_BACKEND."""
+    name = (name or os.getenv("STORAGE_BACKEND", "json")).lower()
+    if name == "sqlite":
+        return SqliteBackend(os.getenv("SQLITE_FILE", SQLITE_FILE))
+    if name == "json":
+        return JsonBackend()
+    raise ValueError(f"Backend de armazenamento desconhecido: {name}")
+
+_backend = JsonBackend()
+
+def get_backend():
+    return _backend
+
+def set_backend(backend):
+    """Troca o backend usado pelas funções load_*/save_* deste módulo."""
+    global _backend
+    _backend = backend
+
 def load_server_settings():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    return _backend.load_server_settings()
 
 def save_server_settings(data):
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    _backend.save_server_settings(data)
+    if _settings_registry is not None and data is not _settings_registry:
+        _settings_registry.invalidate()
 
 def load_user_data():
-    if os.path.exists(USER_DATA_FILE):
-        with open(USER_DATA_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    return _backend.load_user_data()
 
 def save_user_data(data):
-    with open(USER_DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
\ No newline at end of file
+    _backend.save_user_data(data)
+
+def migrate_json_to_sqlite(db_path=SQLITE_FILE, config_file=CONFIG_FILE, user_data_file=USER_DATA_FILE):
+    """Copia user_data.json e server_settings.json para o banco SQLite (uma vez só)."""
+    source = JsonBackend(config_file, user_data_file)
+    target = SqliteBackend(db_path)
+    settings = source.load_server_settings()
+    data = source.load_user_data()
+    target.save_server_settings(settings)
+    target.save_user_data(data)
+    target.close()
+    return len(settings), sum(len(GuildStats.from_dict(guild)) for guild in data.values())
+
+class SettingsRegistry(MutableMapping):
+    """Fonte única em memória do server_settings.
+
+    Funciona como um dict guild_id -> configurações, com busca O(1) de canal e cargo.
+    Recarrega sozinho quando o arquivo é editado à mão (mtime conferido no máximo a
+    cada `check_interval` segundos) e guarda os objetos de canal já resolvidos.
+    Alterações trocam o dict inteiro (copy-on-write), então quem estiver iterando
+    sobre as configurações durante um `await` nunca vê o dict mudar de tamanho.
+    """
+    def __init__(self, backend=None, check_interval=2.0):
+        self.backend = backend or get_backend()
+        self.check_interval = check_interval
+        self._data = {}
+        self._channels = {}  # guild_id -> canal resolvido
+        self._changed = set()  # servidores alterados desde o último save()
+        self._reload_hooks = []
+        self._mtime = None
+        self._checked_at = 0.0
+        self.reload()
+
+    def _source_mtime(self):
+        path = getattr(self.backend, "config_file", None)
+        if path and os.path.exists(path):
+            return os.stat(path).st_mtime_ns
+        return None
+
+    def add_reload_hook(self, hook):
+        """`hook(guild_ids)` é chamado a cada releitura com os servidores que mudaram no disco."""
+        self._reload_hooks.append(hook)
+
+    def reload(self):
+        previous = self._data
+        self._mtime = self._source_mtime()
+        self._checked_at = time.monotonic()
+        self._data = self.backend.load_server_settings()
+        self._channels = {}
+        changed = {gid for gid in previous.keys() | self._data.keys() if previous.get(gid) != self._data.get(gid)}
+        for hook in self._reload_hooks:
+            hook(changed)
+
+    def invalidate(self):
+        """Força a releitura na próxima consulta."""
+        self._checked_at = 0.0
+        self._mtime = -1
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if self._source_mtime() != self._mtime:
+            self.reload()
+            print("🔄 Configurações dos servidores recarregadas do disco.")
+
+    def save(self):
+        with metrics.timer("storage_flush_seconds", store="server_settings"):
+            self.backend.save_server_settings(self._data, self._changed)
+        self._changed = set()
+        self._mtime = self._source_mtime()
+        self._checked_at = time.monotonic()
+
+    def __getitem__(self, guild_id):
+        self.refresh()
+        return self._data[str(guild_id)]
+
+    def __setitem__(self, guild_id, settings):
+        data = dict(self._data)
+        data[str(guild_id)] = settings
+        self._data = data
+        self._changed.add(str(guild_id))
+        self._channels.pop(str(guild_id), None)
+
+    def set_many(self, settings_by_guild):
+        """Várias atribuições de uma vez, copiando o dict uma vez só."""
+        data = dict(self._data)
+        for guild_id, settings in settings_by_guild.items():
+            data[str(guild_id)] = settings
+            self._changed.add(str(guild_id))
+            self._channels.pop(str(guild_id), None)
+        self._data = data
+
+    def __delitem__(self, guild_id):
+        data = dict(self._data)
+        del data[str(guild_id)]
+        self._data = data
+        self._changed.add(str(guild_id))
+        self._channels.pop(str(guild_id), None)
+
+    def __iter__(self):
+        self.refresh()
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def items(self):
+        self.refresh()
+        return self._data.items()  # o dict nunca é alterado no lugar, então a view é estável
+
+    def __contains__(self, guild_id):
+        self.refresh()
+        return str(guild_id) in self._data
+
+    def channel_id(self, guild_id):
+        self.refresh()
+        return self._data.get(str(guild_id), {}).get("channel_id")
+
+    def role_id(self, guild_id):
+        self.refresh()
+        return self._data.get(str(guild_id), {}).get("role_id")
+
+    def timezone(self, guild_id):
+        """Fuso horário do servidor (campo "timezone", padrão DEFAULT_TIMEZONE)."""
+        self.refresh()
+        name = self._data.get(str(guild_id), {}).get("timezone") or default_timezone()
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            return ZoneInfo(default_timezone())
+
+    def time_of_day(self, guild_id, field, default):
+        """Horário "HH:MM" configurado no campo `field` como (hora, minuto)."""
+        self.refresh()
+        value = self._data.get(str(guild_id), {}).get(field) or default
+        try:
+            hour, minute = (int(part) for part in value.split(":"))
+            return hour, minute
+        except ValueError:
+            hour, minute = (int(part) for part in default.split(":"))
+            return hour, minute
+
+    def get_channel(self, bot, guild_id):
+        """Canal configurado do servidor, resolvido uma vez e depois servido do cache."""
+        guild_id = str(guild_id)
+        self.refresh()
+        channel = self._channels.get(guild_id)
+        if channel is None:
+            channel_id = self._data.get(guild_id, {}).get("channel_id")
+            if isinstance(channel_id, int):
+                channel = bot.get_channel(channel_id)
+                if channel is not None:
+                    self._channels[guild_id] = channel
+        return channel
+
+    def forget_channel(self, guild_id):
+        """Descarta o canal em cache (ex.: o canal foi apagado)."""
+        self._channels.pop(str(guild_id), None)
+
+_settings_registry = None
+
+def get_settings_registry():
+    global _settings_registry
+    if _settings_registry is None:
+        _settings_registry = SettingsRegistry()
+    return _settings_registry
+
+ONBOARDING_FILE = "data/onboarding.json"
+
+class OnboardingProgress:
+    """Progresso da configuração inicial de cada servidor, para retomar após reiniciar.
+
+    Com `backend` (SQLite) cada servidor é uma linha em guild_state, lida só pelo
+    processo dono do servidor (`owns`).
+    """
+    KIND = "onboarding"
+
+    def __init__(self, path=ONBOARDING_FILE, backend=None, owns=None):
+        self.path = path
+        self.backend = backend
+        rows = load_guild_state(backend, self.KIND, path, self._file_rows, owns)
+        self._data = {guild_id: progress for guild_id, _, progress in rows}
+
+    @staticmethod
+    def _file_rows(data):
+        return [(guild_id, "progress", progress) for guild_id, progress in data.items()]
+
+    def _save(self, guild_id):
+        if self.backend is not None:
+            self.backend.write_guild_state(self.KIND, [(guild_id, "progress", self._data.get(guild_id))])
+        else:
+            atomic_write(self.path, json.dumps(self._data, indent=4))
+
+    def get(self, guild_id):
+        return dict(self._data.get(str(guild_id), {}))
+
+    def update(self, guild_id, **fields):
+        self._data.setdefault(str(guild_id), {}).update(fields)
+        self._save(str(guild_id))
+
+    def finish(self, guild_id):
+        if self._data.pop(str(guild_id), None) is not None:
+            self._save(str(guild_id))
+
+class UserDataStore:
+    """Persistência write-behind do user_data.
+
+    `data` mapeia guild_id -> GuildStats. Os eventos só marcam o servidor (ou os
+    usuários alterados) como sujo. Uma thread
+    separada junta as alterações e grava a cada `flush_interval` segundos, ou antes
+    disso quando `max_dirty` servidores estiverem sujos. Com backend indexado as
+    consultas de ranking vão direto para o banco, que fica no máximo um
+    `flush_interval` atrás da memória.
+    """
+    def __init__(self, data, backend=None, flush_interval=5.0, max_dirty=50):
+        self.data = data
+        self.backend = backend or get_backend()
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self._dirty = {}  # guild_id -> set de usuários alterados (None = servidor inteiro)
+        self._lock = threading.Lock()        # protege _dirty
+        self._flush_lock = threading.Lock()  # uma gravação por vez
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._hooks = []  # outras gravações que pegam carona na mesma thread
+
+    def add_flush_hook(self, hook):
+        """Registra uma função chamada a cada ciclo de gravação (e no desligamento)."""
+        self._hooks.append(hook)
+
+    def _flush_all(self):
+        self.flush()
+        for hook in self._hooks:
+            hook()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="user-data-flush", daemon=True)
+            self._thread.start()
+
+    def mark_dirty(self, guild_id, *user_ids):
+        guild_id = str(guild_id)
+        keys = [int(user_id) for user_id in user_ids]
+        with self._lock:
+            if not keys:
+                self._dirty[guild_id] = None
+            elif guild_id not in self._dirty:
+                self._dirty[guild_id] = set(keys)
+            elif self._dirty[guild_id] is not None:
+                self._dirty[guild_id].update(keys)
+            pending = len(self._dirty)
+        if pending >= self.max_dirty:
+            self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self._flush_all()
+            except Exception as e:
+                print(f"❌ Erro ao salvar dados dos usuários: {e}")
+
+    def flush(self):
+        """Grava imediatamente o que estiver pendente. Retorna True se algo foi escrito."""
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+            try:
+                start = time.perf_counter()
+                written = self.backend.write_guilds(self.data, dirty)
+                if written:
+                    metrics.observe("storage_flush_seconds", time.perf_counter() - start, store="user_data")
+                    metrics.inc("storage_guilds_written_total", len(dirty))
+                return written
+            except BaseException:
+                # Devolve as alterações para a fila para não perdê-las
+                with self._lock:
+                    for gid, keys in dirty.items():
+                        if keys is None or self._dirty.get(gid, set()) is None:
+                            self._dirty[gid] = None
+                        else:
+                            self._dirty.setdefault(gid, set()).update(keys)
+                raise
+
+    def top_users(self, guild_id, metric, limit=10, ascending=False):
+        """Lista [(user_id, valor)] dos `limit` maiores (ou menores) valores da métrica."""
+        if self.backend.indexed:
+            return self.backend.top_users(guild_id, metric, limit, ascending)
+        guild = self.data.get(str(guild_id))
+        if guild is None:
+            return []
+        pick = heapq.nsmallest if ascending else heapq.nlargest
+        return pick(limit, guild.values(metric), key=lambda item: item[1])
+
+    def close(self):
+        """Para a thread e força uma última gravação (chamar no desligamento)."""
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._flush_all()
+
+SESSION_LOG_FILE = "data/voice_sessions.log"
+SESSION_SNAPSHOT_FILE = "data/voice_sessions.snapshot.json"
+
+class SessionLog:
+    """Log append-only das sessões de voz (entrar/sair/mover).
+
+    Cada evento vira uma linha `evento\\tguild\\tuser\\tcanal\\ttimestamp` anexada ao fim do
+    arquivo, então o custo por evento é uma escrita sequencial pequena. A cada
+    `compact_every` eventos a thread do UserDataStore compacta o log (`compact_if_needed`
+    é um flush hook): as sessões abertas vão para um snapshot e o log recomeça, de modo
+    que na inicialização só a cauda precisa ser reproduzida.
+    """
+    JOIN = "join"
+    LEAVE = "leave"
+    MOVE = "move"
+
+    def __init__(self, path=SESSION_LOG_FILE, snapshot_path=SESSION_SNAPSHOT_FILE, compact_every=50000):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.compact_every = compact_every
+        self.old_path = path + ".old"  # log anterior, até o snapshot que o substitui estar no disco
+        self.open_sessions = {}  # (guild_id, user_id) -> (join_ts, channel_id)
+        self._file = None
+        self._file_lock = threading.Lock()  # troca de arquivo (thread de gravação) x escritas (loop)
+        self._compact_lock = threading.Lock()  # uma compactação por vez (flush hook x close())
+        self._since_compaction = 0
+        self._appends = 0
+        self._append_seconds = 0.0
+        self.last_replay_seconds = 0.0
+        self.last_replay_events = 0
+
+    def replay(self):
+        """Reconstrói as sessões abertas a partir do snapshot + cauda do log."""
+        start = time.perf_counter()
+        self.open_sessions = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                for guild_id, user_id, join_ts, channel_id in json.load(f)["open"]:
+                    self.open_sessions[(guild_id, user_id)] = (join_ts, channel_id)
+        events = 0
+        # O .old só existe se a compactação caiu antes de gravar o snapshot; reaplicar
+        # eventos que o snapshot já contém não muda o resultado
+        for path in (self.old_path, self.path):
+            if not os.path.exists(path):
+                continue
+            open_sessions = self.open_sessions
+            with open(path, "r") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 5:
+                        continue  # linha cortada por um crash no meio da escrita
+                    event, guild_id, user_id, channel_id, ts = parts
+                    key = (guild_id, user_id)
+                    if event == self.JOIN:
+                        open_sessions[key] = (float(ts), int(channel_id) if channel_id else None)
+                    elif event == self.LEAVE:
+                        open_sessions.pop(key, None)
+                    elif event == self.MOVE and key in open_sessions:
+                        open_sessions[key] = (open_sessions[key][0], int(channel_id) if channel_id else None)
+                    events += 1
+        self._since_compaction = events
+        self.last_replay_events = events
+        self.last_replay_seconds = time.perf_counter() - start
+        return self.open_sessions
+
+    def _append(self, event, guild_id, user_id, channel_id, ts):
+        start = time.perf_counter()
+        with self._file_lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path) or "."
+                os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", buffering=1)  # uma escrita por linha
+                if self._file.tell() > 0:
+                    with open(self.path, "rb") as f:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            self._file.write("\n")  # isola a linha cortada de um crash anterior
+            self._file.write(f"{event}\t{guild_id}\t{user_id}\t{channel_id or ''}\t{ts}\n")
+            self._since_compaction += 1
+        self._appends += 1
+        self._append_seconds += time.perf_counter() - start
+
+    def join(self, guild_id, user_id, channel_id, ts):
+        key = (str(guild_id), str(user_id))
+        self.open_sessions[key] = (ts, channel_id)
+        self._append(self.JOIN, *key, channel_id, ts)
+
+    def leave(self, guild_id, user_id, channel_id, ts):
+        key = (str(guild_id), str(user_id))
+        self.open_sessions.pop(key, None)
+        self._append(self.LEAVE, *key, channel_id, ts)
+
+    def move(self, guild_id, user_id, channel_id, ts):
+        key = (str(guild_id), str(user_id))
+        if key in self.open_sessions:
+            self.open_sessions[key] = (self.open_sessions[key][0], channel_id)
+        self._append(self.MOVE, *key, channel_id, ts)
+
+    def compact_if_needed(self):
+        """Flush hook: compacta depois de `compact_every` eventos."""
+        if self._since_compaction >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Salva as sessões abertas em um snapshot e recomeça o log.
+
+        Só a cópia das sessões e a troca de arquivo seguram as escritas do loop; o
+        snapshot é gravado depois. O log anterior vira `.old` e só é apagado com o
+        snapshot já no disco, então um crash no meio ainda deixa o replay correto.
+        Compactações simultâneas (o flush hook e o close() do desligamento) rodam
+        uma depois da outra.
+        """
+        with self._compact_lock:
+            with self._file_lock:
+                open_sessions = dict(self.open_sessions)
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                if os.path.exists(self.path) and os.path.exists(self.old_path):
+                    # Sobra de uma compactação interrompida: junta em vez de sobrescrever
+                    with open(self.old_path, "a") as old, open(self.path, "r") as current:
+                        old.write("\n")
+                        shutil.copyfileobj(current, old)
+                    os.unlink(self.path)
+                elif os.path.exists(self.path):
+                    os.replace(self.path, self.old_path)
+                self._since_compaction = 0
+            atomic_write(self.snapshot_path, self._snapshot_pieces(open_sessions))
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.old_path)
+
+    @staticmethod
+    def _snapshot_pieces(open_sessions, size=5000):
+        """JSON do snapshot em pedaços de `size` sessões.
+
+        Um json.dumps só (ou montar todas as linhas de uma vez, o que dispara uma coleta
+        de lixo completa) seguraria o GIL, e o loop, do começo ao fim.
+        """
+        items = iter(open_sessions.items())
+        yield '{"open": ['
+        separator = ""
+        while chunk := list(itertools.islice(items, size)):
+            yield separator + json.dumps([[g, u, ts, c] for (g, u), (ts, c) in chunk])[1:-1]
+            separator = ", "
+        yield "]}"
+
+    def stats(self):
+        """Custo médio de escrita por evento e tempo da última recuperação."""
+        avg = self._append_seconds / self._appends if self._appends else 0.0
+        return {
+            "appends": self._appends,
+            "avg_append_us": avg * 1e6,
+            "replay_events": self.last_replay_events,
+            "replay_ms": self.last_replay_seconds * 1e3,
+        }
+
+    def close(self):
+        if self._file is not None:
+            self.compact()
+
+if __name__ == "__main__":
+    # python -m utils.database  ->  migra os JSON atuais para o SQLite
+    guilds, rows = migrate_json_to_sqlite(os.getenv("SQLITE_FILE", SQLITE_FILE))
+    print(f"✅ Migrados {guilds} servidores e {rows} registros para o SQLite.")
@@ -0,0 +1,235 @@
+import asyncio
+import contextvars
+import random
+import time
+from collections import OrderedDict
+
+import discord
+from discord.webhook.async_ import async_context
+
+from utils.metrics import metrics
+
+# Limites aproximados dos buckets do Discord: (requisições, janela em segundos)
+ROUTE_LIMITS = {
+    "send_message": (5, 5.0),     # POST /channels/{id}/messages
+    "add_reaction": (1, 0.25),    # PUT /channels/{id}/messages/{id}/reactions/...
+    "edit_message": (5, 5.0),     # PATCH /channels/{id}/messages/{id}
+    "member_roles": (10, 10.0),   # PUT/DELETE /guilds/{id}/members/{id}/roles/{id}
+}
+DEFAULT_ROUTE_LIMIT = (5, 5.0)
+GLOBAL_LIMIT = (45, 1.0)  # o limite global é 50/s; deixa uma folga para o resto do bot
+
+metrics.counter("discord_rest_calls_total", "Chamadas REST feitas pelo dispatcher, por rota e resultado")
+metrics.histogram("discord_rest_seconds", "Duração das chamadas REST (sem a espera pelos baldes)")
+
+# Relatório da rodada em andamento (cada broadcast tem o seu, mesmo se rodarem juntos)
+_current_report = contextvars.ContextVar("current_report", default=None)
+
+class TokenBucket:
+    """Balde de fichas assíncrono: no máximo `capacity` chamadas a cada `per` segundos."""
+    def __init__(self, capacity, per):
+        self.capacity = capacity
+        self.per = per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.per)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * self.per / self.capacity)
+
+class BroadcastReport:
+    """Resultado de uma rodada: tempos da primeira/última mensagem e falhas por servidor."""
+    def __init__(self, name, total):
+        self.name = name
+        self.total = total
+        self.started = time.monotonic()
+        self.finished = None
+        self.first_message = None
+        self.last_message = None
+        self.failures = {}  # guild_id -> exceção
+        self.durations = {}  # guild_id -> segundos do início ao fim do trabalho do servidor
+
+    def message_sent(self):
+        now = time.monotonic()
+        if self.first_message is None:
+            self.first_message = now
+        self.last_message = now
+
+    @property
+    def spread(self):
+        """Segundos entre a primeira e a última mensagem enviada."""
+        if self.first_message is None:
+            return 0.0
+        return self.last_message - self.first_message
+
+    def summary(self):
+        duration = (self.finished or time.monotonic()) - self.started
+        ok = self.total - len(self.failures)
+        slowest = max(self.durations.values(), default=0.0)
+        return (f"📣 {self.name}: {ok}/{self.total} servidores em {duration:.1f}s "
+                f"(primeira → última mensagem: {self.spread:.1f}s, servidor mais lento: {slowest:.1f}s, "
+                f"{len(self.failures)} falhas)")
+
+class BroadcastDispatcher:
+    """Executa o trabalho de cada servidor em paralelo respeitando os limites do Discord.
+
+    Cada chamada REST passa por `call()`, que espera uma ficha do balde global e do
+    balde da rota (ex.: envio de mensagens naquele canal) e repete com backoff em
+    429/5xx. Uma falha em um servidor fica registrada no relatório sem derrubar os
+    outros.
+    """
+    def __init__(self, max_concurrency=25, retries=3, base_delay=1.0, max_routes=10000):
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_routes = max_routes
+        self._global = TokenBucket(*GLOBAL_LIMIT)
+        self._routes = OrderedDict()  # (rota, id) -> TokenBucket
+        self.last_reports = {}  # nome da rodada -> último BroadcastReport
+
+    def _route_bucket(self, route, major_id):
+        key = (route, major_id)
+        bucket = self._routes.get(key)
+        if bucket is None:
+            bucket = self._routes[key] = TokenBucket(*ROUTE_LIMITS.get(route, DEFAULT_ROUTE_LIMIT))
+            while len(self._routes) > self.max_routes:
+                self._routes.popitem(last=False)
+        else:
+            self._routes.move_to_end(key)
+        return bucket
+
+    async def call(self, route, major_id, request):
+        """Executa `request()` (uma função que cria a corrotina) dentro do orçamento da rota."""
+        bucket = self._route_bucket(route, major_id)
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+            await self._global.acquire()
+            start = time.perf_counter()
+            try:
+                result = await request()
+            except discord.HTTPException as e:
+                metrics.observe("discord_rest_seconds", time.perf_counter() - start, route=route)
+                retryable = e.status == 429 or e.status >= 500
+                if not retryable or attempt == self.retries:
+                    metrics.inc("discord_rest_calls_total", route=route, result="error")
+                    raise
+                metrics.inc("discord_rest_calls_total", route=route, result="retry")
+                await asyncio.sleep(self.base_delay * 2 ** attempt + random.uniform(0, self.base_delay))
+                continue
+            metrics.observe("discord_rest_seconds", time.perf_counter() - start, route=route)
+            metrics.inc("discord_rest_calls_total", route=route, result="ok")
+            report = _current_report.get()
+            if route == "send_message" and report is not None:
+                report.message_sent()
+            return result
+
+    async def broadcast(self, name, jobs):
+        """Roda `jobs` ({guild_id: corrotina}) em paralelo e retorna o relatório da rodada."""
+        report = BroadcastReport(name, len(jobs))
+        token = _current_report.set(report)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(guild_id, job):
+            async with semaphore:
+                start = time.monotonic()
+                try:
+                    await job
+                except Exception as e:
+                    report.failures[guild_id] = e
+                    print(f"❌ {name}: falha no servidor {guild_id}: {e}")
+                finally:
+                    report.durations[guild_id] = time.monotonic() - start
+
+        try:
+            await asyncio.gather(*(run(guild_id, job) for guild_id, job in jobs.items()))
+        finally:
+            _current_report.reset(token)
+            report.finished = time.monotonic()
+        self.last_reports[name] = report
+        print(report.summary())
+        return report
+
+class EditDebouncer:
+    """Agrupa edições da mesma mensagem: no máximo uma a cada `interval` segundos.
+
+    `schedule(chave, editar)` não edita nada na hora se a mensagem foi editada há
+    pouco; a função fica pendente e, se outras chegarem antes do disparo, só a última
+    roda. Como `editar` monta o conteúdo quando é chamada, sai sempre o estado atual.
+    """
+    def __init__(self, interval=2.0, max_keys=10000):
+        self.interval = interval
+        self.max_keys = max_keys
+        self._pending = {}             # chave -> função que cria a corrotina da edição
+        self._last = OrderedDict()     # chave -> time.monotonic() da última edição
+        self._tasks = set()
+        self.coalesced = 0             # edições economizadas
+
+    def schedule(self, key, edit):
+        if key in self._pending:
+            self._pending[key] = edit
+            self.coalesced += 1
+            return
+        self._pending[key] = edit
+        task = asyncio.create_task(self._run(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key):
+        last = self._last.get(key)
+        if last is not None:
+            delay = last + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        edit = self._pending.pop(key)
+        self._last[key] = time.monotonic()
+        self._last.move_to_end(key)
+        while len(self._last) > self.max_keys:
+            self._last.popitem(last=False)
+        try:
+            await edit()
+        except Exception as e:
+            print(f"❌ Erro ao editar a mensagem {key}: {e}")
+
+metrics.counter("discord_http_requests_total", "Todas as requisições REST do bot, por método, rota e resultado")
+metrics.histogram("discord_http_seconds", "Duração das requisições REST do bot, por método e rota")
+
+def _timed_request(original):
+    """Envolve um `request(route, ...)` do discord.py para contar e medir por rota."""
+    async def request(route, *args, **kwargs):
+        start = time.perf_counter()
+        result = "ok"
+        try:
+            return await original(route, *args, **kwargs)
+        except discord.HTTPException as e:
+            result = str(e.status)
+            raise
+        except Exception:
+            result = "error"
+            raise
+        finally:
+            metrics.inc("discord_http_requests_total", method=route.method, route=route.path, result=result)
+            metrics.observe("discord_http_seconds", time.perf_counter() - start, method=route.method, route=route.path)
+    return request
+
+def instrument_http(http):
+    """Mede toda requisição REST do cliente (inclusive respostas a interações).
+
+    A rota usada como label é o modelo (`/channels/{channel_id}/messages`), não o
+    caminho com ids, então o número de séries fica pequeno. Respostas a interações,
+    followups e edições da resposta original não passam pelo HTTPClient, e sim pelo
+    adaptador de webhooks do discord.py (uma instância só, o padrão do ContextVar),
+    que também é envolvido.
+    """
+    http.request = _timed_request(http.request)
+    adapter = async_context.get()
+    if not getattr(adapter, "instrumented", False):
+        adapter.request = _timed_request(adapter.request)
+        adapter.instrumented = True
@@ -0,0 +1,74 @@
+import os
+import time
+from collections import Counter
+
+import discord
+
+def gateway_options(lean=False):
+    """Intents e política de cache de membros para o `commands.Bot`.
+
+    Modo normal: presenças + lista completa de membros de cada servidor em cache.
+    Modo enxuto (`lean`): sem o intent de presenças (nenhum código usa) e só quem
+    está em call fica em cache; os poucos lugares que precisam de outros membros
+    pedem ao gateway sob demanda (`find_member`, `role_holders`).
+    """
+    intents = discord.Intents.default()
+    intents.typing = False
+    intents.members = True  # também é o que permite pedir membros sob demanda
+    intents.voice_states = True  # Para receber eventos de voz
+    if not lean:
+        intents.presences = True
+        return {"intents": intents}
+    intents.presences = False
+    flags = discord.MemberCacheFlags.none()
+    flags.voice = True
+    return {"intents": intents, "member_cache_flags": flags, "chunk_guilds_at_startup": False}
+
+async def find_member(guild, user_id):
+    """Membro do cache ou, se não estiver lá (modo enxuto), buscado no gateway sem guardar."""
+    if user_id is None:
+        return None
+    member = guild.get_member(int(user_id))
+    if member is None:
+        found = await guild.query_members(user_ids=[int(user_id)], cache=False)
+        member = found[0] if found else None
+    return member
+
+async def role_holders(guild, role):
+    """Membros com o cargo; sem a lista completa em cache, baixa os membros uma vez sem guardar."""
+    if guild.chunked:
+        return role.members
+    return [m for m in await guild.chunk(cache=False) if m.get_role(role.id) is not None]
+
+def rss_mib():
+    """Memória residente atual do processo (Linux), ou None se não der para medir."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+class GatewayStats:
+    """Eventos do gateway recebidos por tipo, para comparar o modo normal com o enxuto.
+
+    Alimentado por `on_socket_event_type` (o bot precisa de `enable_debug_events=True`).
+    """
+    def __init__(self):
+        self.events = Counter()
+        self.since = time.monotonic()
+
+    def record(self, event_type):
+        self.events[event_type] += 1
+
+    def report(self, bot, mode):
+        """Linha com eventos/s, os tipos mais frequentes, membros em cache e RSS; zera a contagem."""
+        elapsed = max(time.monotonic() - self.since, 1e-9)
+        total = sum(self.events.values())
+        top = ", ".join(f"{name} {count / elapsed:.1f}/s" for name, count in self.events.most_common(3))
+        members = sum(len(guild.members) for guild in bot.guilds)
+        rss = rss_mib()
+        self.events.clear()
+        self.since = time.monotonic()
+        return (f"📡 Gateway ({mode}): {total / elapsed:.1f} eventos/s ({top or 'nenhum'}), "
+                f"{members} membros em cache, RSS {f'{rss:.1f} MiB' if rss is not None else '?'}")
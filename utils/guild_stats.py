@@ -0,0 +1,107 @@
+from array import array
+
+# Métrica -> typecode do array que guarda a coluna
+METRICS = {
+    "time": "d",             # segundos em call
+    "xp": "q",
+    "nivel": "i",
+    "choque_dado": "i",
+    "choque_recebido": "i",
+}
+
+class GuildStats:
+    """Estatísticas de um servidor em colunas: um índice user_id -> linha e um array por métrica.
+
+    Substitui o dict com chaves como "time_<id>" e "choque_dado_<id>": cada usuário
+    ocupa uma linha com alguns bytes por métrica, sem strings por chave. As linhas só
+    são acrescentadas (nunca removidas), o que deixa a cópia feita pela thread de
+    gravação segura mesmo com o loop de eventos alterando os valores.
+    """
+    __slots__ = ("_index", "ids", "columns")
+
+    def __init__(self):
+        self._index = {}          # user_id (int) -> linha
+        self.ids = array("Q")     # linha -> user_id
+        self.columns = {metric: array(typecode) for metric, typecode in METRICS.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, user_id):
+        return int(user_id) in self._index
+
+    def _row(self, user_id):
+        user_id = int(user_id)
+        row = self._index.get(user_id)
+        if row is None:
+            row = len(self.ids)
+            # Colunas primeiro, ids por último: quem copia usa len(ids) e nunca vê linha pela metade
+            for column in self.columns.values():
+                column.append(0)
+            self.ids.append(user_id)
+            self._index[user_id] = row
+        return row
+
+    def get(self, user_id, metric, default=0):
+        row = self._index.get(int(user_id))
+        if row is None:
+            return default
+        return self.columns[metric][row]
+
+    def set(self, user_id, metric, value):
+        column = self.columns[metric]
+        column[self._row(user_id)] = float(value) if column.typecode == "d" else int(value)
+
+    def add(self, user_id, metric, amount):
+        """Soma `amount` à métrica do usuário e retorna o novo valor."""
+        column = self.columns[metric]
+        row = self._row(user_id)
+        column[row] += amount
+        return column[row]
+
+    def values(self, metric):
+        """(user_id, valor) de quem tem a métrica diferente de zero."""
+        column = self.columns[metric]
+        return ((str(user_id), value) for user_id, value in zip(self.ids, column) if value)
+
+    def user_metrics(self, user_id):
+        """{métrica: valor} de um usuário (só as diferentes de zero)."""
+        row = self._index.get(int(user_id))
+        if row is None:
+            return {}
+        return {metric: column[row] for metric, column in self.columns.items() if column[row]}
+
+    # ------------------------------------------------------------ serialização
+
+    def to_dict(self):
+        """Formato colunar compacto: {"ids": [...], "time": [...], ...}."""
+        rows = len(self.ids)
+        data = {"ids": self.ids[:rows].tolist()}
+        for metric, column in self.columns.items():
+            data[metric] = column[:rows].tolist()
+        return data
+
+    def to_legacy(self):
+        """Formato antigo com chaves "<métrica>_<user_id>" (para migração/compatibilidade)."""
+        legacy = {}
+        for metric in self.columns:
+            for user_id, value in self.values(metric):
+                legacy[f"{metric}_{user_id}"] = value
+        return legacy
+
+    @classmethod
+    def from_dict(cls, data):
+        """Aceita o formato colunar ou o antigo (chaves "time_<id>"; "join_" é ignorado)."""
+        stats = cls()
+        if "ids" in data:
+            stats.ids = array("Q", data["ids"])
+            stats._index = {user_id: row for row, user_id in enumerate(stats.ids)}
+            for metric, typecode in METRICS.items():
+                values = data.get(metric) or [0] * len(stats.ids)
+                stats.columns[metric] = array(typecode, map(float if typecode == "d" else int, values))
+            return stats
+        for key, value in data.items():
+            metric, _, user_id = key.rpartition("_")
+            if metric in METRICS and user_id.isdigit():
+                stats.set(user_id, metric, value)
+        return stats
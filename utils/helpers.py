@@ -1,16 +1,150 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
 import discord
 
+from utils.metrics import metrics
+
+metrics.counter("name_lookups_total", "Nomes resolvidos pelo UserNameResolver, por origem (member, cache, query, fetch)")
+metrics.histogram("name_resolve_seconds", "Duração de cada resolve() do UserNameResolver")
+
 def get_channel(bot, guild_id):
-    """Retorna o canal configurado para o servidor."""
-    from utils.database import load_server_settings
-    server_settings = load_server_settings()
-    channel_id = server_settings.get(str(guild_id), {}).get("channel_id")
-    if isinstance(channel_id, int):
-        return bot.get_channel(channel_id)
-    return None
+    """Retorna o canal configurado para o servidor (em cache, sem ler o disco)."""
+    from utils.database import get_settings_registry
+    return get_settings_registry().get_channel(bot, guild_id)
 
 def format_time(seconds):
     """Formata tempo de segundos para horas e minutos."""
     hours = int(seconds // 3600)
     minutes = int((seconds % 3600) // 60)
-    return f"**{hours} horas e {minutes} minutos**"
\ No newline at end of file
+    return f"**{hours} horas e {minutes} minutos**"
+
+COMMAND_SYNC_FILE = "data/command_sync.json"
+
+def command_fingerprint(tree, guild=None):
+    """Hash estável da árvore de comandos slash (nome, descrição, opções...)."""
+    payload = []
+    for command in tree.get_commands(guild=guild):
+        try:
+            data = command.to_dict(tree)  # discord.py >= 2.4
+        except TypeError:
+            data = command.to_dict()
+        payload.append(data)
+    payload.sort(key=lambda data: (data.get("type", 1), data["name"]))
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+async def sync_commands_if_changed(bot, guild=None, path=COMMAND_SYNC_FILE):
+    """Sincroniza os comandos só se a árvore mudou desde a última sincronização.
+
+    Com `guild`, copia os comandos globais para aquele servidor (propagação na hora,
+    bom para desenvolvimento). Retorna a lista sincronizada, ou None se foi pulada.
+    """
+    from utils.database import atomic_write
+    tree = bot.tree
+    if guild is not None:
+        tree.copy_global_to(guild=guild)
+    key = f"{bot.application_id}:{guild.id if guild else 'global'}"
+    fingerprint = command_fingerprint(tree, guild)
+    state = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            state = json.load(f)
+    if state.get(key) == fingerprint:
+        return None
+    synced = await tree.sync(guild=guild)
+    state[key] = fingerprint
+    atomic_write(path, json.dumps(state, indent=4))
+    return synced
+
+class UserNameResolver:
+    """Resolve nomes de usuários para exibição (ex.: /ranking) sem uma chamada REST por vez.
+
+    Ordem de busca: cache de membros do servidor -> cache LRU/TTL de usuários já
+    buscados -> (com `query_gateway`, no modo enxuto) um pedido ao gateway pelos
+    membros que faltam -> `fetch_user` concorrente limitado por um semáforo.
+    A origem de cada nome e a duração de cada resolve() vão para o /metrics
+    (taxa de acerto e p95 saem de `name_lookups_total` e `name_resolve_seconds`).
+    """
+    def __init__(self, bot, max_size=5000, ttl=3600, max_concurrency=5, query_gateway=False):
+        self.bot = bot
+        self.query_gateway = query_gateway
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache = OrderedDict()  # user_id -> (nome, expira_em)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def cached_name(self, guild, user_id, record=True):
+        """Nome sem ir à API, ou None se for preciso buscar."""
+        user_id = int(user_id)
+        member = guild.get_member(user_id) if guild else None
+        if member is not None:
+            if record:
+                metrics.inc("name_lookups_total", source="member")
+            return member.display_name
+        entry = self._cache.get(user_id)
+        if entry is not None:
+            name, expires_at = entry
+            if expires_at > time.monotonic():
+                self._cache.move_to_end(user_id)
+                if record:
+                    metrics.inc("name_lookups_total", source="cache")
+                return name
+            del self._cache[user_id]
+        return None
+
+    def _remember(self, user_id, name):
+        self._cache[user_id] = (name, time.monotonic() + self.ttl)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, user_id):
+        async with self._semaphore:
+            metrics.inc("name_lookups_total", source="fetch")
+            try:
+                user = await self.bot.fetch_user(user_id)
+                name = user.display_name
+            except discord.HTTPException:
+                name = "Usuário desconhecido"
+        self._remember(user_id, name)
+        return name
+
+    async def _query(self, guild, user_ids, names):
+        """Busca no gateway, de uma vez (até 100), os membros fora do cache; retorna os que faltaram."""
+        try:
+            batch = user_ids[:100]
+            members = await guild.query_members(user_ids=batch, limit=len(batch), cache=False)
+        except asyncio.TimeoutError:
+            members = []
+        for member in members:
+            self._remember(member.id, member.display_name)
+            names[member.id] = member.display_name
+        metrics.inc("name_lookups_total", len(members), source="query")
+        return [user_id for user_id in user_ids if user_id not in names]
+
+    def missing(self, guild, user_ids):
+        """IDs que não estão em nenhum cache (se houver, vale adiar a resposta)."""
+        return [int(u) for u in user_ids if self.cached_name(guild, u, record=False) is None]
+
+    async def resolve(self, guild, user_ids):
+        """Retorna {user_id: nome} buscando em paralelo só o que não estiver em cache."""
+        start = time.perf_counter()
+        names, pending = {}, []
+        for user_id in map(int, user_ids):
+            name = self.cached_name(guild, user_id)
+            if name is None:
+                pending.append(user_id)
+            else:
+                names[user_id] = name
+        if pending and guild is not None and self.query_gateway:
+            pending = await self._query(guild, pending, names)
+        if pending:
+            fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in pending))
+            names.update(zip(pending, fetched))
+        metrics.observe("name_resolve_seconds", time.perf_counter() - start)
+        return names
@@ -0,0 +1,219 @@
+import asyncio
+import functools
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+# Limites (em segundos) dos buckets dos histogramas de latência
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Limites (em segundos) para atrasos do agendador, que podem ir de milissegundos a horas
+LAG_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0, 21600.0, 86400.0)
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+class Histogram:
+    """Contagem por bucket, soma e total; o formato é o de histograma do Prometheus."""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # o último é o +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    """Contadores e histogramas em memória, exportados no formato texto do Prometheus.
+
+    Registrar um valor é só somar em um dict (com um lock, porque a thread de gravação
+    também registra), então dá para medir os caminhos quentes sem pesar neles.
+    """
+    def __init__(self):
+        self._help = {}        # nome -> (tipo, descrição, buckets)
+        self._counters = {}    # (nome, labels) -> valor
+        self._histograms = {}  # (nome, labels) -> Histogram
+        self._lock = threading.Lock()
+
+    def counter(self, name, description):
+        self._help[name] = ("counter", description, None)
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS):
+        self._help[name] = ("histogram", description, buckets)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                _, _, buckets = self._help.get(name, (None, None, LATENCY_BUCKETS))
+                histogram = self._histograms[key] = Histogram(buckets or LATENCY_BUCKETS)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        """Decorador para corrotinas: registra a duração de cada chamada em `name`."""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start, **labels)
+            return wrapper
+        return decorator
+
+    def render(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                ((key, list(h.counts), h.sum, h.count, h.buckets) for key, h in self._histograms.items()),
+                key=lambda item: item[0],
+            )
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            description = self._help.get(name, (kind, "", None))[1]
+            if description:
+                lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), counts, total, count, buckets in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+class SamplingProfiler:
+    """Profiler por amostragem do loop de eventos, ligado e desligado em tempo de execução.
+
+    Uma thread olha a pilha da thread alvo a cada `interval` segundos e conta as pilhas
+    vistas; `collapsed()` devolve o formato "a;b;c N" aceito por flamegraph.pl/speedscope.
+    Desligado não custa nada; ligado, o custo é proporcional à frequência de amostragem.
+    """
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._target = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_id=None):
+        """Começa a amostrar a thread `thread_id` (padrão: a que chamou, ou seja, o loop)."""
+        if self.running:
+            return
+        self._target = thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def reset(self):
+        self.samples = Counter()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self, limit=None):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common(limit)) + "\n"
+
+# Registro único usado pelo bot e pelos módulos de utils
+metrics = MetricsRegistry()
+profiler = SamplingProfiler()
+
+async def _handle(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await reader.readline()).strip():
+            pass  # descarta os cabeçalhos
+        parts = request.decode("latin-1").split()
+        path = parts[1] if len(parts) > 1 else "/"
+        status = "200 OK"
+        if path == "/metrics":
+            body = metrics.render()
+        elif path == "/profile/start":
+            profiler.start(threading.main_thread().ident)
+            body = "profiler ligado\n"
+        elif path == "/profile/stop":
+            profiler.stop()
+            body = "profiler desligado\n"
+        elif path == "/profile/reset":
+            profiler.reset()
+            body = "amostras apagadas\n"
+        elif path == "/profile":
+            body = profiler.collapsed()
+        else:
+            status, body = "404 Not Found", "rotas: /metrics /profile /profile/start /profile/stop /profile/reset\n"
+        payload = body.encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server(host="127.0.0.1", port=9108):
+    """Servidor HTTP mínimo com /metrics (Prometheus) e o controle do profiler."""
+    return await asyncio.start_server(_handle, host, port)
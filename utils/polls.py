@@ -0,0 +1,204 @@
+import json
+import time
+from collections import OrderedDict
+
+from utils.database import WriteBehindFile
+
+PASSOU_FILE = "data/passou_polls.json"
+DAILY_POLLS_FILE = "data/daily_polls.json"
+
+class PassouPolls(WriteBehindFile):
+    """Estado das votações do /passou, indexado pelo id da mensagem.
+
+    Guarda só dados (quem acusou, contagem, quem votou), nunca objetos de View, e é
+    gravado pela thread do UserDataStore, então os votos sobrevivem a reinícios. A
+    ordem do OrderedDict é a da última atividade: votações paradas há mais de `ttl`
+    segundos são encerradas e, passando de `max_open`, a menos recente sai primeiro.
+    No SQLite cada votação é uma linha (guild_id, id da mensagem).
+    """
+    KIND = "passou"
+
+    def __init__(self, path=PASSOU_FILE, max_open=500, ttl=24 * 3600, backend=None, owns=None):
+        super().__init__(path, backend, owns)
+        self.max_open = max_open
+        self.ttl = ttl
+        self._polls = OrderedDict()  # message_id (str) -> votação
+
+    def _expire(self, now):
+        while self._polls:
+            message_id, poll = next(iter(self._polls.items()))
+            if len(self._polls) <= self.max_open and now - poll["updated"] <= self.ttl:
+                break
+            self._polls.popitem(last=False)
+            self._mark((poll["guild"], message_id))
+
+    def open(self, message_id, guild_id, channel_id, accuser_id, accused_id):
+        now = time.time()
+        self._polls[str(message_id)] = {
+            "guild": str(guild_id),
+            "channel": channel_id,
+            "accuser": accuser_id,
+            "accused": accused_id,
+            "sim": 0,
+            "nao": 0,
+            "condemned": False,
+            "voted": set(),
+            "updated": now,
+        }
+        self._mark((str(guild_id), str(message_id)))
+        self._expire(now)
+
+    def get(self, message_id):
+        """A votação, ou None se não existir ou já tiver expirado."""
+        self._expire(time.time())
+        return self._polls.get(str(message_id))
+
+    def _touch(self, message_id, poll):
+        poll["updated"] = time.time()
+        self._polls.move_to_end(str(message_id))
+        self._mark((poll["guild"], str(message_id)))
+
+    def vote(self, message_id, user_id, choice):
+        """Registra o voto ("sim" ou "nao"); False se a pessoa já tinha votado."""
+        poll = self.get(message_id)
+        if poll is None or user_id in poll["voted"]:
+            return False
+        poll["voted"].add(user_id)
+        poll[choice] += 1
+        self._touch(message_id, poll)
+        return True
+
+    def condemn(self, message_id):
+        """Marca como condenado; False se já estava (ou a votação não existe)."""
+        poll = self.get(message_id)
+        if poll is None or poll["condemned"]:
+            return False
+        poll["condemned"] = True
+        self._touch(message_id, poll)
+        return True
+
+    def __len__(self):
+        return len(self._polls)
+
+    # ---------------------------------------------------------------- disco
+
+    @staticmethod
+    def _file_rows(data):
+        # Votações gravadas antes do campo "guild" ficam de fora (expiram em um dia de qualquer jeito)
+        return [(poll["guild"], message_id, poll) for message_id, poll in data.items() if "guild" in poll]
+
+    def _load_rows(self, rows):
+        polls = sorted(((message_id, poll) for _, message_id, poll in rows), key=lambda item: item[1]["updated"])
+        self._polls = OrderedDict((message_id, dict(poll, voted=set(poll["voted"]))) for message_id, poll in polls)
+        self._expire(time.time())
+
+    def _rows(self, dirty):
+        rows = []
+        for guild_id, message_id in dirty:
+            poll = self._polls.get(message_id)
+            rows.append((guild_id, message_id, dict(poll, voted=list(poll["voted"])) if poll is not None else None))
+        return rows
+
+    def _serialize(self, dirty):
+        return json.dumps({
+            message_id: dict(poll, voted=list(poll["voted"]))
+            for message_id, poll in list(self._polls.items())
+        })
+
+class DailyPollTally(WriteBehindFile):
+    """Votos da enquete diária, contados conforme as reações chegam.
+
+    `register()` guarda o id da mensagem da enquete em um índice pequeno (por ordem
+    de postagem; enquetes com mais de `max_age` segundos saem sozinhas) e cada
+    reação adicionada/removida só soma ou subtrai no contador do servidor naquele
+    dia, sem buscar a mensagem nem a lista de quem reagiu. Os contadores guardam os
+    últimos `retention` dias de cada servidor. No SQLite cada mensagem é uma linha
+    (guild_id, "msg:<id>") e cada dia outra, (guild_id, "day:<dia>").
+    """
+    KIND = "daily_polls"
+
+    def __init__(self, path=DAILY_POLLS_FILE, max_age=2 * 86400, retention=7, backend=None, owns=None):
+        super().__init__(path, backend, owns)
+        self.max_age = max_age
+        self.retention = retention
+        self._messages = OrderedDict()  # message_id (str) -> [guild_id, dia, postada em]
+        self._counts = {}               # guild_id -> {dia: {emoji: votos}}
+
+    def _expire(self, now):
+        while self._messages:
+            message_id, (guild_id, _, posted) = next(iter(self._messages.items()))
+            if now - posted <= self.max_age:
+                break
+            self._messages.popitem(last=False)
+            self._mark((guild_id, "msg:" + message_id))
+
+    def register(self, message_id, guild_id, day):
+        """Passa a contar as reações da mensagem `message_id` como votos de `day` ('2025-03-14')."""
+        now = time.time()
+        guild_id = str(guild_id)
+        self._messages[str(message_id)] = [guild_id, day, now]
+        days = self._counts.setdefault(guild_id, {})
+        days.setdefault(day, {})
+        for old in sorted(days)[:-self.retention]:
+            del days[old]
+            self._mark((guild_id, "day:" + old))
+        self._mark((guild_id, "msg:" + str(message_id)), (guild_id, "day:" + day))
+        self._expire(now)
+
+    def react(self, message_id, emoji, delta):
+        """Soma `delta` (+1/-1) ao voto; False se a mensagem não é uma enquete acompanhada."""
+        self._expire(time.time())
+        entry = self._messages.get(str(message_id))
+        if entry is None:
+            return False
+        guild_id, day, _ = entry
+        bucket = self._counts.setdefault(guild_id, {}).setdefault(day, {})
+        bucket[emoji] = max(0, bucket.get(emoji, 0) + delta)
+        self._mark((guild_id, "day:" + day))
+        return True
+
+    def results(self, guild_id, day):
+        """{emoji: votos} da enquete do servidor no dia (vazio se não houve enquete)."""
+        return dict(self._counts.get(str(guild_id), {}).get(day, {}))
+
+    # ---------------------------------------------------------------- disco
+
+    @staticmethod
+    def _file_rows(data):
+        rows = [(guild_id, "msg:" + message_id, [day, posted])
+                for message_id, (guild_id, day, posted) in data.get("messages", {}).items()]
+        rows.extend((guild_id, "day:" + day, bucket)
+                    for guild_id, days in data.get("counts", {}).items() for day, bucket in days.items())
+        return rows
+
+    def _load_rows(self, rows):
+        messages, self._counts = [], {}
+        for guild_id, row_key, value in rows:
+            kind, _, name = row_key.partition(":")
+            if kind == "msg":
+                messages.append((name, [guild_id, *value]))
+            else:
+                self._counts.setdefault(guild_id, {})[name] = value
+        self._messages = OrderedDict(sorted(messages, key=lambda item: item[1][2]))
+        self._expire(time.time())
+
+    def _rows(self, dirty):
+        rows = []
+        for guild_id, row_key in dirty:
+            kind, _, name = row_key.partition(":")
+            if kind == "msg":
+                entry = self._messages.get(name)
+                rows.append((guild_id, row_key, entry[1:] if entry is not None else None))
+            else:
+                bucket = self._counts.get(guild_id, {}).get(name)
+                rows.append((guild_id, row_key, dict(bucket) if bucket is not None else None))
+        return rows
+
+    def _serialize(self, dirty):
+        return json.dumps({
+            "messages": dict(list(self._messages.items())),
+            "counts": {
+                guild_id: {day: dict(bucket) for day, bucket in list(days.items())}
+                for guild_id, days in list(self._counts.items())
+            },
+        })
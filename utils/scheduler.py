@@ -0,0 +1,183 @@
+import asyncio
+import heapq
+import itertools
+import json
+import time as clock
+from datetime import datetime, time, timedelta, timezone
+
+from utils.database import atomic_write, load_guild_state
+from utils.metrics import metrics, LAG_BUCKETS
+
+SCHEDULER_STATE_FILE = "data/scheduler_state.json"
+
+metrics.histogram("scheduler_lag_seconds", "Atraso do disparo em relação ao horário marcado", LAG_BUCKETS)
+metrics.histogram("scheduler_job_seconds", "Duração de um lote de uma tarefa agendada")
+
+def next_occurrence(after, hour, minute, tz, day=None):
+    """Próximo horário local `hour:minute` (no dia `day` do mês, se dado) estritamente depois de `after`."""
+    local_date = after.astimezone(tz).date()
+    for offset in range(0, 370):
+        d = local_date + timedelta(days=offset)
+        if day is not None and d.day != day:
+            continue
+        candidate = datetime.combine(d, time(hour, minute), tz)
+        if candidate > after:
+            return candidate
+    raise ValueError("Nenhuma ocorrência encontrada no próximo ano")
+
+def previous_occurrence(before, hour, minute, tz, day=None):
+    """Último horário local `hour:minute` (no dia `day`, se dado) menor ou igual a `before`."""
+    local_date = before.astimezone(tz).date()
+    for offset in range(0, 370):
+        d = local_date - timedelta(days=offset)
+        if day is not None and d.day != day:
+            continue
+        candidate = datetime.combine(d, time(hour, minute), tz)
+        if candidate <= before:
+            return candidate
+    raise ValueError("Nenhuma ocorrência encontrada no último ano")
+
+class Scheduler:
+    """Agendador único para todas as tarefas de todos os servidores.
+
+    Cada tarefa (ex.: "daily_poll") é registrada uma vez com uma função que diz o
+    horário local, o fuso e, opcionalmente, o dia do mês para cada servidor. Os
+    próximos disparos ficam em um heap e um único loop dorme até o primeiro deles.
+    Servidores com o mesmo horário são disparados juntos em uma só chamada. O último
+    disparo de cada (tarefa, servidor) é salvo em disco, então se o bot estiver fora
+    do ar no horário a tarefa é executada ao voltar (dentro de `max_lateness`).
+    No modo cluster, `owns(guild_id)` diz se o servidor é deste processo; os outros
+    nem entram no heap, então cada tarefa roda só no processo dono do shard, e os
+    últimos disparos ficam no SQLite (`backend`), uma linha por (servidor, tarefa).
+    """
+    KIND = "scheduler"
+
+    def __init__(self, path=SCHEDULER_STATE_FILE, owns=None, backend=None):
+        self.path = path
+        self.owns = owns
+        self.backend = backend
+        self._kinds = {}      # nome -> (callback, when, max_lateness)
+        self._heap = []       # (timestamp, seq, nome, guild_id)
+        self._next = {}       # (nome, guild_id) -> timestamp agendado
+        self._last_run = {}   # "nome:guild_id" -> timestamp do último disparo
+        self._seq = itertools.count()
+        self._wake = None
+        self._task = None
+        self._running = set()
+        self._in_flight = set()  # (nome, guild_id) executando agora
+        for guild_id, name, run_at in load_guild_state(backend, self.KIND, path, self._file_rows, owns):
+            self._last_run[f"{name}:{guild_id}"] = run_at
+
+    @staticmethod
+    def _file_rows(data):
+        rows = []
+        for marker, run_at in data.items():
+            name, _, guild_id = marker.partition(":")
+            rows.append((guild_id, name, run_at))
+        return rows
+
+    def register(self, name, callback, when, max_lateness):
+        """`callback(lista de (guild_id, horário local))`; `when(guild_id)` -> (hora, minuto, fuso, dia ou None)."""
+        self._kinds[name] = (callback, when, max_lateness)
+
+    def _push(self, name, guild_id, run_at):
+        self._next[(name, guild_id)] = run_at
+        heapq.heappush(self._heap, (run_at, next(self._seq), name, guild_id))
+        if self._wake is not None:
+            self._wake.set()
+
+    def schedule(self, guild_id, force=False):
+        """Agenda as tarefas de um servidor, recuperando disparos perdidos.
+
+        Tarefas já agendadas são mantidas, a menos que `force` (ex.: horário mudou).
+        "Já rodou" é decidido pela data local do último disparo, não pelo horário: se
+        o horário muda para mais tarde no mesmo dia, a tarefa não roda de novo hoje.
+        """
+        guild_id = str(guild_id)
+        if self.owns is not None and not self.owns(guild_id):
+            return
+        now = datetime.now(timezone.utc)
+        for name, (_, when, max_lateness) in self._kinds.items():
+            key = (name, guild_id)
+            if key in self._in_flight or (key in self._next and not force):
+                continue
+            hour, minute, tz, day = when(guild_id)
+            previous = previous_occurrence(now, hour, minute, tz, day)
+            marker = self._last_run.get(f"{name}:{guild_id}")
+            if marker is None:
+                # Primeira vez que vemos o servidor: nada para recuperar
+                self._last_run[f"{name}:{guild_id}"] = previous.timestamp()
+                ran_on = previous.date()
+            else:
+                ran_on = datetime.fromtimestamp(marker, tz).date()
+            if ran_on < previous.date() and now - previous <= max_lateness:
+                run_at = previous  # perdido enquanto o bot estava fora: roda já
+            else:
+                run_at = next_occurrence(now, hour, minute, tz, day)
+                while run_at.date() <= ran_on:
+                    run_at = next_occurrence(run_at, hour, minute, tz, day)  # esse dia já teve disparo
+            self._push(name, guild_id, run_at.timestamp())
+
+    def unschedule(self, guild_id):
+        for name in self._kinds:
+            self._next.pop((name, str(guild_id)), None)  # as entradas no heap viram lixo
+
+    def start(self):
+        """Inicia o loop (chamadas repetidas, como em reconexões, não fazem nada)."""
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    def _pop_due(self, now):
+        """Tira do heap tudo que já venceu, agrupado por tarefa."""
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            run_at, _, name, guild_id = heapq.heappop(self._heap)
+            if self._next.get((name, guild_id)) != run_at:
+                continue  # reagendado ou removido
+            del self._next[(name, guild_id)]
+            self._in_flight.add((name, guild_id))
+            due.setdefault(name, []).append((guild_id, run_at))
+        return due
+
+    async def _loop(self):
+        while True:
+            now = clock.time()
+            for name, jobs in self._pop_due(now).items():
+                task = asyncio.create_task(self._run(name, jobs))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            delay = self._heap[0][0] - clock.time() if self._heap else None
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, name, jobs):
+        callback, when, _ = self._kinds[name]
+        batch = []
+        for guild_id, run_at in jobs:
+            tz = when(guild_id)[2]
+            batch.append((guild_id, datetime.fromtimestamp(run_at, tz)))
+        lag = clock.time() - min(run_at for _, run_at in jobs)
+        print(f"⏰ {name}: {len(batch)} servidores (atraso de {lag:.1f}s)")
+        for _, run_at in jobs:
+            metrics.observe("scheduler_lag_seconds", clock.time() - run_at, job=name)
+        try:
+            with metrics.timer("scheduler_job_seconds", job=name):
+                await callback(batch)
+        except Exception as e:
+            print(f"❌ Erro em {name}: {e}")
+        finally:
+            for guild_id, run_at in jobs:
+                self._in_flight.discard((name, guild_id))
+                self._last_run[f"{name}:{guild_id}"] = run_at
+                hour, minute, tz, day = when(guild_id)
+                after = datetime.fromtimestamp(max(run_at, clock.time()), timezone.utc)
+                self._push(name, guild_id, next_occurrence(after, hour, minute, tz, day).timestamp())
+            if self.backend is not None:
+                rows = [(guild_id, name, self._last_run[f"{name}:{guild_id}"]) for guild_id, _ in jobs]
+                await asyncio.to_thread(self.backend.write_guild_state, self.KIND, rows)
+            else:
+                await asyncio.to_thread(atomic_write, self.path, json.dumps(self._last_run))
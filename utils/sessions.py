@@ -0,0 +1,97 @@
+XP_PER_BLOCK = 10
+XP_BLOCK_SECONDS = 600  # 10 XP a cada 10 minutos de sessão
+
+class ActiveSession:
+    """Uma pessoa em call agora. __slots__ para caber muita gente sem pesar."""
+    __slots__ = ("channel_id", "started", "last_credit", "session_seconds", "xp_credited", "paused")
+
+    def __init__(self, channel_id, started, paused):
+        self.channel_id = channel_id
+        self.started = started
+        self.last_credit = started
+        self.session_seconds = 0.0  # tempo já creditado nesta sessão (sem pausas)
+        self.xp_credited = 0
+        self.paused = paused        # AFK ou surdo: não acumula
+
+class Credit:
+    """Tempo/XP a somar para um usuário: intervalo [start, end) e o XP correspondente."""
+    __slots__ = ("guild_id", "user_id", "start", "end", "xp")
+
+    def __init__(self, guild_id, user_id, start, end, xp):
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.start = start
+        self.end = end
+        self.xp = xp
+
+    @property
+    def seconds(self):
+        return self.end - self.start
+
+class ActiveSessions:
+    """Tabela de quem está em call, creditada aos poucos por `tick()`.
+
+    O XP continua sendo `duração // 600 * 10` da sessão inteira: cada crédito entrega só
+    a diferença para o que já foi pago, então dividir a sessão em vários créditos não
+    muda o total. Tempo pausado (canal AFK ou surdo) não conta.
+    """
+    def __init__(self):
+        self._sessions = {}  # (guild_id, user_id) -> ActiveSession
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, key):
+        return key in self._sessions
+
+    def keys(self):
+        return list(self._sessions)
+
+    def _credit(self, key, session, now):
+        if now <= session.last_credit:
+            return None
+        start, session.last_credit = session.last_credit, now
+        if session.paused:
+            return None
+        session.session_seconds += now - start
+        xp_total = int(session.session_seconds // XP_BLOCK_SECONDS) * XP_PER_BLOCK
+        xp, session.xp_credited = xp_total - session.xp_credited, xp_total
+        return Credit(key[0], key[1], start, now, xp)
+
+    def start(self, guild_id, user_id, channel_id, now, paused=False, started=None):
+        session = ActiveSession(channel_id, now, paused)
+        if started is not None:
+            session.started = started  # sessão recuperada: só o tempo a partir de agora conta
+        self._sessions[(str(guild_id), str(user_id))] = session
+
+    def update(self, guild_id, user_id, channel_id, paused, now):
+        """Troca de canal ou de estado (AFK/surdo): credita o trecho anterior e segue."""
+        key = (str(guild_id), str(user_id))
+        session = self._sessions.get(key)
+        if session is None:
+            return None
+        credit = self._credit(key, session, now)
+        session.channel_id = channel_id
+        session.paused = paused
+        return credit
+
+    def stop(self, guild_id, user_id, now):
+        """Fim da sessão: credita o que faltava e remove da tabela."""
+        key = (str(guild_id), str(user_id))
+        session = self._sessions.pop(key, None)
+        if session is None:
+            return None
+        return self._credit(key, session, now)
+
+    def discard(self, guild_id, user_id):
+        """Remove sem creditar (ex.: saiu enquanto o bot estava desconectado)."""
+        return self._sessions.pop((str(guild_id), str(user_id)), None) is not None
+
+    def tick(self, now):
+        """Credita todo mundo de uma vez: uma passada linear pela tabela."""
+        credits = []
+        for key, session in self._sessions.items():
+            credit = self._credit(key, session, now)
+            if credit is not None:
+                credits.append(credit)
+        return credits
@@ -0,0 +1,219 @@
+import heapq
+import json
+from datetime import datetime, time, timedelta
+
+from utils.database import WriteBehindFile, join_fragments
+
+ROLLUPS_FILE = "data/voice_rollups.json"
+
+DAY = "dia"
+WEEK = "semana"
+MONTH = "mes"
+PERIODS = (DAY, WEEK, MONTH)
+
+# Quantos buckets de cada período manter (o resto é descartado ao abrir um novo)
+RETENTION = {DAY: 35, WEEK: 10, MONTH: 13}
+
+def period_key(period, moment):
+    """Chave do bucket de `moment` (datetime local): '2025-03-14', '2025-W11', '2025-03'."""
+    if period == DAY:
+        return moment.strftime("%Y-%m-%d")
+    if period == WEEK:
+        year, week, _ = moment.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == MONTH:
+        return moment.strftime("%Y-%m")
+    raise ValueError(f"Período desconhecido: {period}")
+
+def split_by_day(start_ts, end_ts, tz=None):
+    """Quebra o intervalo [start_ts, end_ts) nas meias-noites locais: [(datetime, segundos)]."""
+    pieces = []
+    while start_ts < end_ts:
+        start = datetime.fromtimestamp(start_ts, tz)
+        # timestamp() já leva em conta horário de verão, diferente de subtrair datetimes
+        midnight = datetime.combine(start.date() + timedelta(days=1), time.min, start.tzinfo).timestamp()
+        piece_end = min(midnight, end_ts)
+        pieces.append((start, piece_end - start_ts))
+        start_ts = piece_end
+    return pieces
+
+class VoiceRollups(WriteBehindFile):
+    """Tempo em call por servidor em buckets de dia, semana e mês.
+
+    O tempo é somado no bucket certo quando a sessão é creditada (sessões que passam
+    da meia-noite são divididas), e cada bucket mantém um top-k já ordenado. Como os
+    totais dentro de um período só crescem, o top-k incremental é exato: o ranking
+    sai em O(k) sem ordenar todos os usuários. Para o mês também há um heap de mínimo
+    (com entradas antigas descartadas na leitura) usado pelo prêmio do Tchudu Master.
+
+    No SQLite cada bucket é uma linha (guild_id, "período:chave"); só os alterados
+    (o dia, a semana e o mês atuais) são regravados.
+    """
+    KIND = "rollups"
+
+    def __init__(self, path=ROLLUPS_FILE, top_k=10, backend=None, owns=None):
+        super().__init__(path, backend, owns)
+        self.top_k = top_k
+        self._buckets = {}  # guild_id -> {período: {chave: {user_id: segundos}}}
+        self._tops = {}     # (guild_id, período, chave) -> [[user_id, segundos], ...] decrescente
+        self._min_heaps = {}  # (guild_id, chave do mês) -> [(segundos, user_id)]
+        self._fragments = {}  # (guild_id, período, chave) -> JSON do bucket na última gravação
+
+    # ---------------------------------------------------------------- escrita
+
+    def add(self, guild_id, user_id, start_ts, end_ts, tz=None):
+        """Credita o intervalo [start_ts, end_ts) ao usuário, dividido por dia."""
+        self.add_many(guild_id, [(user_id, start_ts, end_ts)], tz)
+
+    def add_many(self, guild_id, intervals, tz=None):
+        """Como `add` para vários (user_id, início, fim) do mesmo servidor, ex.: um tick.
+
+        As chaves de período e os buckets são buscados uma vez por dia local, e a
+        divisão por dia é feita uma vez por intervalo distinto (num tick quase todos
+        os créditos têm o mesmo início e fim).
+        """
+        guild_id = str(guild_id)
+        guild = self._buckets.setdefault(guild_id, {period: {} for period in PERIODS})
+        targets_by_day = {}  # data local -> [(período, chave, bucket, top, heap do mês)]
+        pieces_by_interval = {}
+        for user_id, start_ts, end_ts in intervals:
+            user_id = str(user_id)
+            pieces = pieces_by_interval.get((start_ts, end_ts))
+            if pieces is None:
+                pieces = pieces_by_interval[(start_ts, end_ts)] = [
+                    (self._targets(guild_id, guild, moment, targets_by_day), seconds)
+                    for moment, seconds in split_by_day(start_ts, end_ts, tz)
+                ]
+            for targets, seconds in pieces:
+                for _, _, bucket, top, heap in targets:
+                    total = bucket.get(user_id, 0) + seconds
+                    bucket[user_id] = total
+                    self._bump_top(top, user_id, total)
+                    if heap is not None:
+                        self._push_min(heap, bucket, user_id, total)
+        self._mark(*((guild_id, period, key) for targets in targets_by_day.values() for period, key, *_ in targets))
+
+    def _targets(self, guild_id, guild, moment, cache):
+        """Buckets (e tops) do dia, da semana e do mês de `moment`, criados se preciso."""
+        targets = cache.get(moment.date())
+        if targets is None:
+            targets = cache[moment.date()] = []
+            for period in PERIODS:
+                key = period_key(period, moment)
+                buckets = guild[period]
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = {}
+                    self._prune(guild_id, period)
+                top = self._tops.setdefault((guild_id, period, key), [])
+                heap = self._min_heaps.setdefault((guild_id, key), []) if period == MONTH else None
+                targets.append((period, key, bucket, top, heap))
+        return targets
+
+    def _bump_top(self, top, user_id, total):
+        if len(top) == self.top_k and total <= top[-1][1]:
+            return  # fora do top (se estivesse, o total novo passaria do último)
+        for i, (u_id, _) in enumerate(top):
+            if u_id == user_id:
+                del top[i]
+                break
+        if len(top) < self.top_k or total > top[-1][1]:
+            i = len(top)
+            while i > 0 and top[i - 1][1] < total:
+                i -= 1
+            top.insert(i, [user_id, total])
+            del top[self.top_k:]
+
+    def _push_min(self, heap, bucket, user_id, total):
+        heapq.heappush(heap, (total, user_id))
+        if len(heap) > 2 * len(bucket) + 64:
+            # Muitas entradas velhas: reconstrói só com os valores atuais
+            heap[:] = [(seconds, u_id) for u_id, seconds in bucket.items()]
+            heapq.heapify(heap)
+
+    def _prune(self, guild_id, period):
+        buckets = self._buckets[guild_id][period]
+        for key in sorted(buckets)[:-RETENTION[period]]:
+            del buckets[key]
+            self._mark((guild_id, period, key))
+            self._tops.pop((guild_id, period, key), None)
+            self._min_heaps.pop((guild_id, key), None)
+
+    # ---------------------------------------------------------------- leitura
+
+    def top(self, guild_id, period, moment=None, limit=10):
+        """[(user_id, segundos)] dos que mais ficaram em call no período de `moment`."""
+        key = period_key(period, moment or datetime.now())
+        return [tuple(entry) for entry in self._tops.get((str(guild_id), period, key), [])[:limit]]
+
+    def totals(self, guild_id, period, moment=None):
+        """{user_id: segundos} do bucket (vazio se não houver dados)."""
+        key = period_key(period, moment or datetime.now())
+        return self._buckets.get(str(guild_id), {}).get(period, {}).get(key, {})
+
+    def month_minimum(self, guild_id, moment):
+        """(user_id, segundos) de quem ficou menos tempo em call no mês, ou None."""
+        guild_id = str(guild_id)
+        key = period_key(MONTH, moment)
+        bucket = self.totals(guild_id, MONTH, moment)
+        heap = self._min_heaps.get((guild_id, key))
+        while heap:
+            seconds, user_id = heap[0]
+            if bucket.get(user_id) == seconds:
+                return user_id, seconds
+            heapq.heappop(heap)  # valor antigo, o usuário já acumulou mais
+        return None
+
+    # ---------------------------------------------------------------- disco
+
+    @staticmethod
+    def _file_rows(data):
+        return [
+            (guild_id, f"{period}:{key}", bucket)
+            for guild_id, guild in data.items()
+            for period, buckets in guild.items()
+            for key, bucket in buckets.items()
+        ]
+
+    def _load_rows(self, rows):
+        self._buckets = {}
+        for guild_id, row_key, bucket in rows:
+            period, _, key = row_key.partition(":")
+            self._buckets.setdefault(guild_id, {p: {} for p in PERIODS})[period][key] = bucket
+        self._tops, self._min_heaps = {}, {}
+        for guild_id, guild in self._buckets.items():
+            for period, buckets in guild.items():
+                for key, bucket in buckets.items():
+                    best = heapq.nlargest(self.top_k, bucket.items(), key=lambda item: item[1])
+                    self._tops[(guild_id, period, key)] = [list(item) for item in best]
+                    if period == MONTH:
+                        heap = [(seconds, u_id) for u_id, seconds in bucket.items()]
+                        heapq.heapify(heap)
+                        self._min_heaps[(guild_id, key)] = heap
+
+    def _rows(self, dirty):
+        rows = []
+        for guild_id, period, key in dirty:
+            bucket = self._buckets.get(guild_id, {}).get(period, {}).get(key)
+            rows.append((guild_id, f"{period}:{key}", dict(bucket) if bucket is not None else None))
+        return rows
+
+    def _serialize(self, dirty):
+        """Serializa de novo só os buckets alterados (o dia, a semana e o mês atuais);
+        os buckets antigos reaproveitam o JSON da gravação anterior."""
+        fragments = {}
+        guilds = {}
+        for guild_id, guild in list(self._buckets.items()):
+            periods = {}
+            for period, buckets in list(guild.items()):
+                keys = {}
+                for key, bucket in list(buckets.items()):
+                    fragment_key = (guild_id, period, key)
+                    fragment = self._fragments.get(fragment_key)
+                    if fragment is None or fragment_key in dirty:
+                        fragment = json.dumps(dict(bucket))
+                    fragments[fragment_key] = keys[key] = fragment
+                periods[period] = join_fragments(keys)
+            guilds[guild_id] = join_fragments(periods)
+        self._fragments = fragments  # buckets descartados pelo _prune saem junto
+        return join_fragments(guilds)